@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+
+import cv2
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Проверяемые номера камер: 0 .. MAX_CAMERAS - 1
+MAX_CAMERAS = 8
+# Общее время ожидания ответа от камер (сек); зависшие драйверы не задерживают поиск
+PROBE_TIMEOUT = 3.0
+# Найденные камеры запоминаются между запусками
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".historical_facade_cameras.json")
+
+
+def probe_camera(index):
+    """Проверка камеры: открывается и отдает кадр"""
+    camera = cv2.VideoCapture(index)
+    try:
+        # grab() получает кадр без декодирования
+        return camera.isOpened() and camera.grab()
+    finally:
+        camera.release()
+
+
+def discover_cameras(max_index=MAX_CAMERAS, timeout=PROBE_TIMEOUT, busy=()):
+    """Одновременная проверка номеров камер с общим таймаутом.
+
+    Каждая камера проверяется в своем фоновом потоке, поэтому отсутствующие
+    устройства не задерживают поиск по очереди. Камеры из busy уже открыты
+    сканером и считаются доступными без проверки.
+    """
+    found = set(busy)
+    lock = threading.Lock()
+
+    def probe(index):
+        try:
+            available = probe_camera(index)
+        except cv2.error:
+            available = False
+        if available:
+            with lock:
+                found.add(index)
+
+    threads = [
+        threading.Thread(target=probe, args=(index,), daemon=True)
+        for index in range(max_index) if index not in found
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    with lock:
+        return sorted(found)
+
+
+def load_cached_cameras(path=CACHE_FILE):
+    """Камеры, найденные при прошлом запуске (None, если кэша нет)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            cameras = json.load(f)["cameras"]
+        return [int(index) for index in cameras]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_cached_cameras(cameras, path=CACHE_FILE):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"cameras": list(cameras)}, f)
+    except OSError:
+        pass
+
+
+class CameraDiscoveryThread(QThread):
+    """Фоновый поиск камер с сохранением результата в кэш"""
+    found = pyqtSignal(list)
+
+    def __init__(self, busy=(), parent=None):
+        super().__init__(parent)
+        self.busy = tuple(busy)
+
+    def run(self):
+        cameras = discover_cameras(busy=self.busy)
+        save_cached_cameras(cameras)
+        self.found.emit(cameras)
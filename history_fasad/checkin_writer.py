@@ -0,0 +1,158 @@
+import csv
+import queue
+import sqlite3
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import storage
+
+# Наибольшее число посещений, записываемых одной транзакцией
+MAX_BATCH = 100
+# Время (сек), в течение которого посещения собираются в одну транзакцию
+COMMIT_INTERVAL = 0.1
+# Число попыток записи пачки целиком, после которых посещения пишутся по одному
+WRITE_RETRIES = 3
+# Пауза перед повторной записью (сек); удваивается после каждой неудачи
+RETRY_DELAY = 0.2
+MAX_RETRY_DELAY = 5.0
+# Сколько (сек) при остановке продолжаются попытки записать оставшиеся посещения
+STOP_TIMEOUT = 10.0
+
+
+class CheckInWriter(QThread):
+    """Единственный поток записи посещений в базу.
+
+    Сканеры всех камер ставят считанные коды в общую очередь, запись идет
+    строго последовательно через отдельное соединение. Посещения,
+    поступившие за COMMIT_INTERVAL, записываются одной транзакцией (group
+    commit), GUI-поток диска не касается. Результат каждой регистрации
+    передается в GUI сигналом checked_in.
+
+    Незаписанные посещения не теряются: пока база занята, они остаются в
+    очереди и повторяются с нарастающей паузой. Посещения, которые так и не
+    удалось записать до остановки, сохраняются в файл рядом с базой.
+    """
+    # id, qr_data, ФИО, организация, время (сек Unix), мероприятие, новый посетитель, камера
+    checked_in = pyqtSignal(int, str, str, str, "qint64", str, bool, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_name, parent=None):
+        super().__init__(parent)
+        self.db_name = db_name
+        self.requests = queue.Queue()
+
+    def submit(self, qr_data, visit_time, event, station=None, camera_index=-1):
+        self.requests.put(((qr_data, visit_time, event, station), camera_index))
+
+    def stop(self):
+        """Остановка после записи всех поставленных в очередь посещений.
+
+        Если база занята, попытки продолжаются до STOP_TIMEOUT, затем
+        оставшиеся посещения сохраняются в файл. Перед закрытием соединения
+        журнал WAL переносится в файл базы.
+        """
+        self.requests.put(None)
+        self.wait()
+
+    def next_batch(self, timeout=None):
+        """Ожидание первого посещения и сбор поступивших следом.
+
+        Пачка закрывается через COMMIT_INTERVAL после первого посещения
+        или при достижении MAX_BATCH. Если за timeout ничего не поступило,
+        возвращается пустой список. Возвращает список и признак остановки.
+        """
+        batch = []
+        try:
+            request = self.requests.get(timeout=timeout)
+        except queue.Empty:
+            return batch, False
+        deadline = time.monotonic() + COMMIT_INTERVAL
+        while request is not None:
+            batch.append(request)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= MAX_BATCH or remaining <= 0:
+                return batch, False
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def write_batch(self, conn, batch, one_by_one=False):
+        """Запись пачки одной транзакцией или по одному посещению.
+
+        Если пачка не записывается из-за ошибки в одном посещении, посещения
+        пишутся по одному и теряется только ошибочное. Ошибки доступа к базе
+        (sqlite3.OperationalError) временные: посещение и все следующие за ним
+        повторяются позже. Возвращает пары (посещение, результат) и посещения,
+        которые нужно повторить.
+        """
+        if not one_by_one:
+            try:
+                results = storage.check_in_many(conn, [check_in for check_in, _ in batch])
+                return list(zip(batch, results)), []
+            except sqlite3.OperationalError:
+                # База занята - пачка повторяется позже
+                return [], batch
+            except Exception:
+                pass
+
+        written = []
+        for index, request in enumerate(batch):
+            try:
+                written.append((request, storage.check_in(conn, *request[0])))
+            except sqlite3.OperationalError:
+                # База занята - остаток пачки ждет следующей попытки
+                return written, batch[index:]
+            except Exception as e:
+                self.failed.emit(f"Посещение не записано ({request[0][0]}): {e}")
+        return written, []
+
+    def save_unsaved(self, batch):
+        """Сохранение незаписанных посещений в CSV рядом с базой"""
+        path = f"{self.db_name}.unsaved.csv"
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            csv.writer(f, delimiter=";").writerows(check_in for check_in, _ in batch)
+        self.failed.emit(f"База недоступна, {len(batch)} посещений сохранено в {path}")
+
+    def run(self):
+        conn = storage.connect(self.db_name)
+        retry = []
+        failures = 0
+        stopping = False
+        stop_deadline = None
+        try:
+            while not stopping or retry:
+                delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** failures)
+                if stopping:
+                    # Новых посещений не будет, дописываем оставшиеся
+                    if time.monotonic() >= stop_deadline:
+                        break
+                    time.sleep(delay)
+                    batch = []
+                else:
+                    batch, stopping = self.next_batch(delay if retry else None)
+                    if stopping:
+                        stop_deadline = time.monotonic() + STOP_TIMEOUT
+                batch = retry + batch
+                if not batch:
+                    continue
+
+                written, retry = self.write_batch(conn, batch, failures >= WRITE_RETRIES)
+                if retry:
+                    failures += 1
+                    if failures == WRITE_RETRIES:
+                        self.failed.emit("База занята, посещения будут записаны позже")
+                else:
+                    failures = 0
+                for ((qr_data, visit_time, event, _), camera_index), result in written:
+                    visitor_id, full_name, organization, is_new = result
+                    self.checked_in.emit(
+                        visitor_id, qr_data, full_name, organization, visit_time, event, is_new, camera_index
+                    )
+        finally:
+            if retry:
+                self.save_unsaved(retry)
+            storage.checkpoint(conn)
+            conn.close()
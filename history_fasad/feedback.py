@@ -0,0 +1,49 @@
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QLabel
+
+# Цвета уведомлений: новый посетитель, повторный визит, ошибка
+COLORS = {
+    "new": "#27ae60",
+    "repeat": "#2980b9",
+    "error": "#e74c3c",
+}
+
+
+class ToastOverlay(QLabel):
+    """Немодальное уведомление поверх окна, скрывается само.
+
+    Не перехватывает мышь и не останавливает обработку событий, поэтому
+    сканирование продолжается, пока уведомление на экране. Новое сообщение
+    сразу заменяет предыдущее.
+    """
+
+    def __init__(self, parent, duration=2500):
+        super().__init__(parent)
+        self.duration = duration
+        self.setAlignment(Qt.AlignCenter)
+        self.setWordWrap(True)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.hide)
+        self.hide()
+
+    def show_message(self, text, kind="new"):
+        self.setStyleSheet(f"""
+            QLabel {{
+                background-color: {COLORS[kind]};
+                color: white;
+                font-size: 18px;
+                font-weight: bold;
+                padding: 12px 24px;
+                border-radius: 10px;
+            }}
+        """)
+        self.setText(text)
+        parent = self.parentWidget()
+        self.setFixedWidth(max(300, min(600, parent.width() - 40)))
+        self.adjustSize()
+        self.move((parent.width() - self.width()) // 2, 20)
+        self.raise_()
+        self.show()
+        self.timer.start(self.duration)
@@ -1,22 +1,34 @@
 import sys
 import os
-import sqlite3
+import time
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
-                            QLabel, QPushButton, QWidget, QTableWidget, 
-                            QTableWidgetItem, QMessageBox, QLineEdit, 
+                            QLabel, QPushButton, QWidget, QTableView, 
+                            QMessageBox, QLineEdit, 
                             QStackedWidget, QListWidget, QComboBox, 
-                            QSpinBox, QFrame, QFileDialog, QGroupBox)
+                            QSpinBox, QFrame, QFileDialog, QGroupBox, QListWidgetItem,
+                            QGridLayout, QCheckBox)
 from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QIcon, QPixmap, QFont, QImage, QPalette, QColor
+from PyQt5.QtGui import QIcon, QPixmap, QFont, QPalette, QColor
 import qrcode
-from pyzbar.pyzbar import decode
-import cv2
-import openpyxl
-from PIL import Image
-import io
-import pandas as pd
 import uuid
+from scanner import CameraScanner, FrameDecoder, ScanDebouncer, SCAN_COOLDOWN
+import storage
+from visitor_model import VisitorTableModel
+from qr_tasks import start_generation, start_export
+import qr_engine
+import qr_export
+import visitor_export
+from functools import partial
+from qt_image import pil_to_qimage
+from workbook_cache import WorkbookCache
+from table_readers import FILE_FILTER
+import multiprocessing
+import math
+import platform
+from checkin_writer import CheckInWriter
+from camera_discovery import CameraDiscoveryThread, load_cached_cameras
+from feedback import ToastOverlay, COLORS
 
 class MainApp(QMainWindow):
     def __init__(self):
@@ -158,18 +170,18 @@ class MainApp(QMainWindow):
             QLineEdit:focus, QComboBox:focus, QSpinBox:focus {
                 border-color: #3498db;
             }
-            QTableWidget {
+            QTableView {
                 border: 2px solid #bdc3c7;
                 border-radius: 8px;
                 font-size: 14px;
                 background-color: white;
                 gridline-color: #ecf0f1;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #ecf0f1;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3498db;
                 color: white;
             }
@@ -251,9 +263,11 @@ class MainApp(QMainWindow):
         # Настройка левой панели
         # Выбор камеры
         camera_select_layout = QHBoxLayout()
-        camera_label = QLabel("Выберите камеру:")
-        self.camera_combo = QComboBox()
-        self.camera_combo.setMinimumWidth(200)
+        camera_label = QLabel("Выберите камеры:")
+        # Можно отметить несколько камер - по одной на каждый вход
+        self.camera_list = QListWidget()
+        self.camera_list.setMinimumWidth(200)
+        self.camera_list.setMaximumHeight(80)
         self.refresh_cameras_btn = QPushButton("🔄")
         self.refresh_cameras_btn.setFixedSize(30, 30)
         self.refresh_cameras_btn.setStyleSheet("""
@@ -268,23 +282,45 @@ class MainApp(QMainWindow):
         """)
         
         camera_select_layout.addWidget(camera_label)
-        camera_select_layout.addWidget(self.camera_combo)
+        camera_select_layout.addWidget(self.camera_list)
         camera_select_layout.addWidget(self.refresh_cameras_btn)
         left_layout.addLayout(camera_select_layout)
         
-        self.camera_label = QLabel()
-        self.camera_label.setAlignment(Qt.AlignCenter)
+        # Область кадра для распознавания
+        roi_layout = QHBoxLayout()
+        roi_label = QLabel("Область сканирования:")
+        self.roi_combo = QComboBox()
+        self.roi_combo.addItem("Весь кадр", None)
+        self.roi_combo.addItem("Центр кадра", (0.25, 0.25, 0.5, 0.5))
+        roi_layout.addWidget(roi_label)
+        roi_layout.addWidget(self.roi_combo)
+        left_layout.addLayout(roi_layout)
+        
+        # Пауза перед повторной обработкой того же QR-кода
+        cooldown_layout = QHBoxLayout()
+        cooldown_label = QLabel("Повторный скан через:")
+        self.cooldown_spin = QSpinBox()
+        self.cooldown_spin.setRange(1, 600)
+        self.cooldown_spin.setValue(int(SCAN_COOLDOWN))
+        self.cooldown_spin.setSuffix(" сек")
+        cooldown_layout.addWidget(cooldown_label)
+        cooldown_layout.addWidget(self.cooldown_spin)
+        left_layout.addLayout(cooldown_layout)
+        
+        self.sound_check = QCheckBox("Звуковой сигнал при регистрации")
+        self.sound_check.setChecked(True)
+        left_layout.addWidget(self.sound_check)
+        
+        self.camera_label = self.make_preview_tile("Камера не активирована")
         self.camera_label.setMinimumSize(400, 300)
-        self.camera_label.setStyleSheet("""
-            QLabel {
-                background-color: #2c3e50;
-                border: 3px solid #34495e;
-                border-radius: 8px;
-                color: white;
-                font-weight: bold;
-            }
-        """)
-        self.camera_label.setText("Камера не активирована")
+        
+        # Окна предпросмотра камер: по плитке на каждую запущенную камеру
+        self.preview_widget = QWidget()
+        self.preview_layout = QGridLayout(self.preview_widget)
+        self.preview_layout.setContentsMargins(0, 0, 0, 0)
+        self.preview_layout.setSpacing(5)
+        self.preview_layout.addWidget(self.camera_label, 0, 0)
+        self.preview_tiles = {}
         
         self.scan_button = QPushButton("▶ Начать сканирование")
         self.scan_button.setStyleSheet("""
@@ -306,7 +342,7 @@ class MainApp(QMainWindow):
             }
         """)
         
-        left_layout.addWidget(self.camera_label)
+        left_layout.addWidget(self.preview_widget)
         left_layout.addWidget(self.scan_button)
         left_layout.addStretch()
         
@@ -320,10 +356,14 @@ class MainApp(QMainWindow):
         event_layout.addWidget(self.event_input)
         right_layout.addLayout(event_layout)
         
-        self.visitor_table = QTableWidget()
-        self.visitor_table.setColumnCount(4)
-        self.visitor_table.setHorizontalHeaderLabels(["ФИО", "Организация", "Время посещения", "Мероприятие"])
+        # Поиск по журналу посетителей
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск по ФИО, организации или мероприятию...")
+        right_layout.addWidget(self.search_input)
+        
+        self.visitor_table = QTableView()
         self.visitor_table.horizontalHeader().setStretchLastSection(True)
+        self.visitor_table.verticalHeader().setVisible(False)
         
         button_layout = QHBoxLayout()
         self.export_button = QPushButton("📊 Экспорт в Excel")
@@ -342,6 +382,23 @@ class MainApp(QMainWindow):
             }
         """)
         
+        self.export_new_button = QPushButton("📥 Экспорт новых")
+        self.export_new_button.setToolTip("Выгрузить только посещения после прошлой выгрузки")
+        self.export_new_button.setStyleSheet("""
+            QPushButton {
+                background-color: #16a085;
+                border: none;
+                color: white;
+                padding: 10px 20px;
+                font-size: 14px;
+                font-weight: bold;
+                border-radius: 6px;
+            }
+            QPushButton:hover {
+                background-color: #138d75;
+            }
+        """)
+        
         self.clear_db_button = QPushButton("🗑️ Очистить базу")
         self.clear_db_button.setStyleSheet("""
             QPushButton {
@@ -359,6 +416,7 @@ class MainApp(QMainWindow):
         """)
         
         button_layout.addWidget(self.export_button)
+        button_layout.addWidget(self.export_new_button)
         button_layout.addWidget(self.clear_db_button)
         button_layout.addStretch()
         
@@ -368,45 +426,118 @@ class MainApp(QMainWindow):
         # Инициализация базы данных
         self.init_db()
         
-        # Настройка камеры
-        self.camera = None
-        self.timer = QTimer()
+        # Настройка камер: по сканеру на каждую выбранную камеру
+        self.scanners = {}
         self.scanning = False
+        self.debouncer = ScanDebouncer(self.cooldown_spin.value())
+        self.camera_discovery = None
+        self.visitors_export_thread = None
+        # Результат скана показывается без модальных окон, сканирование не прерывается
+        self.toast = ToastOverlay(self)
         
-        # Заполняем список камер
+        # Сразу показываем камеры с прошлого запуска, список уточняется в фоне
+        cached_cameras = load_cached_cameras()
+        if cached_cameras is not None:
+            self.fill_camera_list(cached_cameras)
         self.refresh_cameras()
         
         # Подключение сигналов
         self.scan_button.clicked.connect(self.toggle_scan)
-        self.timer.timeout.connect(self.update_frame)
         self.export_button.clicked.connect(self.export_to_excel)
+        self.export_new_button.clicked.connect(self.export_new_visits)
         self.clear_db_button.clicked.connect(self.clear_database)
         self.refresh_cameras_btn.clicked.connect(self.refresh_cameras)
+        self.cooldown_spin.valueChanged.connect(self.update_cooldown)
+        self.search_input.textChanged.connect(self.visitor_model.set_filter)
         
         # Добавляем виджет в стек
         self.stacked_widget.addWidget(self.scanner_widget)
     
+    def make_preview_tile(self, text):
+        """Окно предпросмотра одной камеры"""
+        tile = QLabel()
+        tile.setAlignment(Qt.AlignCenter)
+        self.set_tile_border(tile, "#34495e")
+        tile.setText(text)
+        return tile
+    
+    def set_tile_border(self, tile, color):
+        tile.setStyleSheet(f"""
+            QLabel {{
+                background-color: #2c3e50;
+                border: 3px solid {color};
+                border-radius: 8px;
+                color: white;
+                font-weight: bold;
+            }}
+        """)
+    
+    def flash_tile(self, camera_index, kind):
+        """Подсветка рамки камеры, считавшей код"""
+        tile = self.preview_tiles.get(camera_index)
+        if tile is None:
+            return
+        self.set_tile_border(tile, COLORS[kind])
+        QTimer.singleShot(800, partial(self.reset_tile_border, tile))
+    
+    def reset_tile_border(self, tile):
+        # Плитка могла быть удалена после остановки сканирования
+        if tile in self.preview_tiles.values():
+            self.set_tile_border(tile, "#34495e")
+    
+    def notify_scan(self, text, kind, camera_index=-1):
+        """Немодальное уведомление о результате скана: всплывающее сообщение, рамка и звук"""
+        self.toast.show_message(text, kind)
+        self.flash_tile(camera_index, kind)
+        if self.sound_check.isChecked():
+            QApplication.beep()
+    
     def refresh_cameras(self):
-        """Обновление списка доступных камер"""
-        self.camera_combo.clear()
-        
-        # Проверяем доступные камеры
-        index = 0
-        cameras = []
-        while True:
-            cap = cv2.VideoCapture(index)
-            if not cap.read()[0]:
-                break
-            else:
-                cameras.append(index)
-            cap.release()
-            index += 1
+        """Фоновый поиск доступных камер"""
+        if self.camera_discovery and self.camera_discovery.isRunning():
+            return
+        if not self.camera_list.count():
+            item = QListWidgetItem("Поиск камер...")
+            item.setFlags(Qt.NoItemFlags)
+            self.camera_list.addItem(item)
+        self.refresh_cameras_btn.setEnabled(False)
+        # Камеры, занятые сканированием, не проверяются повторно
+        self.camera_discovery = CameraDiscoveryThread(busy=self.scanners.keys())
+        self.camera_discovery.found.connect(self.on_cameras_found)
+        self.camera_discovery.start()
+    
+    def on_cameras_found(self, cameras):
+        self.refresh_cameras_btn.setEnabled(True)
+        self.fill_camera_list(cameras)
+    
+    def fill_camera_list(self, cameras):
+        """Заполнение списка камер с сохранением отметок"""
+        checked = set(self.selected_cameras())
+        if not checked.intersection(cameras):
+            # По умолчанию включена первая камера
+            checked = set(cameras[:1])
+        self.camera_list.clear()
         
         if cameras:
             for cam_index in cameras:
-                self.camera_combo.addItem(f"Камера {cam_index}", cam_index)
+                item = QListWidgetItem(f"Камера {cam_index}")
+                item.setData(Qt.UserRole, cam_index)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked if cam_index in checked else Qt.Unchecked)
+                self.camera_list.addItem(item)
         else:
-            self.camera_combo.addItem("Камеры не найдены", -1)
+            item = QListWidgetItem("Камеры не найдены")
+            item.setFlags(Qt.NoItemFlags)
+            self.camera_list.addItem(item)
+    
+    def selected_cameras(self):
+        """Номера отмеченных камер"""
+        cameras = []
+        for row in range(self.camera_list.count()):
+            item = self.camera_list.item(row)
+            if item.checkState() == Qt.Checked:
+                cameras.append(item.data(Qt.UserRole))
+        return cameras
     
     def init_generator_mode(self):
         """Инициализация режима генерации"""
@@ -603,14 +734,38 @@ class MainApp(QMainWindow):
             }
         """)
         
+        save_archive_btn = QPushButton("🗜️ Сохранить в один файл (ZIP/PDF)")
+        save_archive_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #16a085;
+                border: none;
+                color: white;
+                padding: 10px 20px;
+                font-size: 14px;
+                font-weight: bold;
+                border-radius: 6px;
+            }
+            QPushButton:hover {
+                background-color: #138d75;
+            }
+        """)
+        
         save_layout.addWidget(save_current_btn)
         save_layout.addWidget(save_all_btn)
+        save_layout.addWidget(save_archive_btn)
         generator_layout.addWidget(save_frame)
         
         # Основные переменные
         self.excel_file = None
         self.current_qr = None
         self.qr_codes = {}
+        self.qr_size = None
+        # Отрисованные коды хранятся только для недавно просмотренных записей
+        self.qr_pixmaps = qr_engine.LRUCache(32)
+        # Разобранные книги Excel: листы, заголовки и колонки читаются один раз
+        self.workbooks = WorkbookCache()
+        self.generation_thread = None
+        self.export_thread = None
         
         # Подключение сигналов
         file_btn.clicked.connect(self.load_excel_file)
@@ -619,25 +774,25 @@ class MainApp(QMainWindow):
         self.data_list.itemClicked.connect(self.show_qr_code)
         save_current_btn.clicked.connect(self.save_current_qr)
         save_all_btn.clicked.connect(self.save_all_qr)
+        save_archive_btn.clicked.connect(self.save_qr_archive)
         
         # Добавляем виджет в стек
         self.stacked_widget.addWidget(self.generator_widget)
     
     # Методы для режима сканирования
     def init_db(self):
-        self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS visitors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT,
-                organization TEXT,
-                qr_data TEXT UNIQUE,
-                visit_time DATETIME,
-                event TEXT
-            )
-        ''')
-        self.conn.commit()
+        self.conn = storage.connect(self.db_name)
+        storage.init_schema(self.conn)
+        self.visitor_model = VisitorTableModel(self.conn)
+        # Посещения со всех камер записываются одним потоком по очереди
+        self.writer = CheckInWriter(self.db_name)
+        self.writer.checked_in.connect(self.on_checked_in)
+        self.writer.failed.connect(self.on_writer_failed)
+        self.writer.start()
+        self.visitor_table.setModel(self.visitor_model)
+        # Сортировка выполняется запросом к базе, по умолчанию - новые посещения сверху
+        self.visitor_table.horizontalHeader().setSortIndicator(2, Qt.DescendingOrder)
+        self.visitor_table.setSortingEnabled(True)
         self.update_visitors_table()
     
     def clear_database(self):
@@ -650,8 +805,8 @@ class MainApp(QMainWindow):
         
         if reply == QMessageBox.Yes:
             try:
-                self.cursor.execute("DELETE FROM visitors")
-                self.conn.commit()
+                storage.clear(self.conn)
+                self.debouncer.clear()
                 self.update_visitors_table()
                 QMessageBox.information(self, "Успешно", "База данных очищена")
             except Exception as e:
@@ -659,17 +814,23 @@ class MainApp(QMainWindow):
     
     def toggle_scan(self):
         if not self.scanning:
-            # Получаем выбранную камеру
-            camera_index = self.camera_combo.currentData()
-            if camera_index == -1:
-                QMessageBox.warning(self, "Ошибка", "Не найдено доступных камер!")
+            # Получаем выбранные камеры
+            camera_indexes = self.selected_cameras()
+            if not camera_indexes:
+                QMessageBox.warning(self, "Ошибка", "Не выбрано ни одной доступной камеры!")
                 return
             
             try:
-                self.camera = cv2.VideoCapture(camera_index)
-                if not self.camera.isOpened():
-                    QMessageBox.warning(self, "Ошибка", "Не удалось открыть камеру!")
-                    return
+                self.show_preview_tiles(camera_indexes)
+                # У каждой камеры свои потоки захвата и распознавания,
+                # повторные считывания отсекаются общим фильтром
+                for camera_index in camera_indexes:
+                    decoder = FrameDecoder(roi=self.roi_combo.currentData())
+                    scanner = CameraScanner(camera_index, decoder, self.debouncer)
+                    scanner.frame_ready.connect(partial(self.update_frame, camera_index))
+                    scanner.qr_detected.connect(partial(self.process_qr_code, camera_index=camera_index))
+                    scanner.failed.connect(partial(self.on_scanner_failed, camera_index))
+                    self.scanners[camera_index] = scanner
                 
                 self.scanning = True
                 self.scan_button.setText("⏹️ Остановить сканирование")
@@ -688,134 +849,185 @@ class MainApp(QMainWindow):
                         background-color: #c0392b;
                     }
                 """)
-                self.timer.start(20)
+                for scanner in self.scanners.values():
+                    scanner.start()
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка при запуске камеры: {str(e)}")
         else:
-            self.scanning = False
-            self.scan_button.setText("▶ Начать сканирование")
-            self.scan_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #27ae60;
-                    border: none;
-                    color: white;
-                    padding: 12px 24px;
-                    text-align: center;
-                    font-size: 16px;
-                    font-weight: bold;
-                    border-radius: 8px;
-                }
-                QPushButton:hover {
-                    background-color: #219653;
-                }
-            """)
-            self.timer.stop()
-            if self.camera and self.camera.isOpened():
-                self.camera.release()
-            self.camera_label.clear()
-            self.camera_label.setText("Камера отключена")
-    
-    def update_frame(self):
-        if self.camera and self.camera.isOpened():
-            ret, frame = self.camera.read()
-            if ret:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                decoded_objects = decode(frame)
-                
-                if decoded_objects:
-                    qr_data = decoded_objects[0].data.decode('utf-8')
-                    self.process_qr_code(qr_data)
-                
-                h, w, ch = frame_rgb.shape
-                bytes_per_line = ch * w
-                q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.camera_label.setPixmap(QPixmap.fromImage(q_img).scaled(
-                    self.camera_label.width(), 
-                    self.camera_label.height(), 
-                    Qt.KeepAspectRatio
-                ))
-    
-    def process_qr_code(self, qr_data):
+            self.stop_scanning()
+    
+    def stop_scanning(self):
+        self.scanning = False
+        self.scan_button.setText("▶ Начать сканирование")
+        self.scan_button.setStyleSheet("""
+            QPushButton {
+                background-color: #27ae60;
+                border: none;
+                color: white;
+                padding: 12px 24px;
+                text-align: center;
+                font-size: 16px;
+                font-weight: bold;
+                border-radius: 8px;
+            }
+            QPushButton:hover {
+                background-color: #219653;
+            }
+        """)
+        for scanner in self.scanners.values():
+            scanner.stop()
+        self.scanners.clear()
+        self.clear_preview_tiles()
+        self.camera_label.setText("Камера отключена")
+    
+    def show_preview_tiles(self, camera_indexes):
+        """Размещение плиток предпросмотра сеткой"""
+        self.clear_preview_tiles()
+        self.camera_label.hide()
+        columns = math.ceil(math.sqrt(len(camera_indexes)))
+        for position, camera_index in enumerate(camera_indexes):
+            tile = self.make_preview_tile(f"Камера {camera_index}")
+            tile.setToolTip(f"Камера {camera_index}")
+            if len(camera_indexes) == 1:
+                tile.setMinimumSize(400, 300)
+            else:
+                tile.setMinimumSize(200, 150)
+            self.preview_layout.addWidget(tile, position // columns, position % columns)
+            self.preview_tiles[camera_index] = tile
+    
+    def clear_preview_tiles(self):
+        for tile in self.preview_tiles.values():
+            self.preview_layout.removeWidget(tile)
+            tile.deleteLater()
+        self.preview_tiles.clear()
+        self.camera_label.show()
+    
+    def update_cooldown(self, value):
+        self.debouncer.cooldown = value
+    
+    def on_scanner_failed(self, camera_index, message):
+        scanner = self.scanners.pop(camera_index, None)
+        if scanner:
+            scanner.stop()
+        if not self.scanners:
+            self.stop_scanning()
+            QMessageBox.warning(self, "Ошибка", f"Камера {camera_index}: {message}")
+            return
+        # Остальные камеры продолжают работу
+        tile = self.preview_tiles.get(camera_index)
+        if tile:
+            tile.clear()
+            tile.setText(f"Камера {camera_index}\n{message}")
+    
+    def update_frame(self, camera_index, q_img):
+        """Отображение кадра, полученного из потока захвата"""
+        tile = self.preview_tiles.get(camera_index)
+        if not self.scanning or tile is None:
+            return
+        tile.setPixmap(QPixmap.fromImage(q_img).scaled(
+            tile.width(), 
+            tile.height(), 
+            Qt.KeepAspectRatio
+        ))
+    
+    def process_qr_code(self, qr_data, camera_index=-1):
+        """Постановка считанного кода в очередь записи"""
+        visit_time = int(time.time())
+        event = self.event_input.text() or "Не указано"
+        station = f"{platform.node()}/Камера {camera_index}" if camera_index >= 0 else platform.node()
+        self.writer.submit(qr_data, visit_time, event, station, camera_index)
+    
+    def on_writer_failed(self, message):
+        self.notify_scan(f"Произошла ошибка: {message}", "error")
+    
+    def on_checked_in(self, visitor_id, qr_data, full_name, organization, visit_time, event, is_new, camera_index):
         try:
-            self.cursor.execute("SELECT * FROM visitors WHERE qr_data=?", (qr_data,))
-            visitor = self.cursor.fetchone()
+            self.visitor_model.record_check_in(
+                visitor_id, qr_data, full_name, organization, visit_time, event
+            )
             
-            if visitor:
-                visit_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                event = self.event_input.text() or "Не указано"
-                self.cursor.execute(
-                    "UPDATE visitors SET visit_time=?, event=? WHERE qr_data=?",
-                    (visit_time, event, qr_data)
-                )
-                self.conn.commit()
-                
-                QMessageBox.information(
-                    self, "Успешно", 
-                    f"Посетитель {visitor[1]} уже зарегистрирован.\nВремя обновлено."
-                )
+            if is_new:
+                self.notify_scan(f"Новый посетитель {full_name} зарегистрирован!", "new", camera_index)
             else:
-                visit_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                event = self.event_input.text() or "Не указано"
-                
-                parts = qr_data.split(';')
-                full_name = parts[0] if len(parts) > 0 else "Неизвестный"
-                organization = parts[1] if len(parts) > 1 else "Не указана"
-                
-                self.cursor.execute(
-                    "INSERT INTO visitors (full_name, organization, qr_data, visit_time, event) "
-                    "VALUES (?, ?, ?, ?, ?)",
-                    (full_name, organization, qr_data, visit_time, event)
-                )
-                self.conn.commit()
-                
-                QMessageBox.information(
-                    self, "Успешно", 
-                    f"Новый посетитель {full_name} зарегистрирован!"
+                self.notify_scan(
+                    f"Посетитель {full_name} уже зарегистрирован.\nВремя обновлено.", "repeat", camera_index
                 )
             
-            self.update_visitors_table()
-            
         except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
+            self.notify_scan(f"Произошла ошибка: {str(e)}", "error", camera_index)
     
     def update_visitors_table(self):
-        self.cursor.execute("SELECT full_name, organization, visit_time, event FROM visitors ORDER BY visit_time DESC")
-        visitors = self.cursor.fetchall()
-        
-        self.visitor_table.setRowCount(len(visitors))
-        for row, visitor in enumerate(visitors):
-            for col, data in enumerate(visitor):
-                item = QTableWidgetItem(str(data))
-                item.setTextAlignment(Qt.AlignCenter)
-                self.visitor_table.setItem(row, col, item)
-        
+        """Полная перезагрузка таблицы (при запуске и после очистки базы)"""
+        self.visitor_model.reload()
         self.visitor_table.resizeColumnsToContents()
     
     def export_to_excel(self):
+        if self.visitors_export_thread and self.visitors_export_thread.isRunning():
+            return
         try:
-            self.cursor.execute("SELECT full_name, organization, visit_time, event FROM visitors")
-            visitors = self.cursor.fetchall()
+            total = self.conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
             
-            if not visitors:
+            if not total:
                 QMessageBox.warning(self, "Предупреждение", "Нет данных для экспорта")
                 return
             
             file_path, _ = QFileDialog.getSaveFileName(
-                self, "Сохранить как Excel", "visitors.xlsx", "Excel Files (*.xlsx)"
+                self, "Сохранить как Excel", "visitors.xlsx", visitor_export.FILE_FILTER
             )
             
             if file_path:
-                df = pd.DataFrame(visitors, columns=["ФИО", "Организация", "Время посещения", "Мероприятие"])
-                df.to_excel(file_path, index=False)
-                
-                QMessageBox.information(self, "Успешно", f"Данные экспортированы в {file_path}")
+                # Выгрузка идет пачками в фоновом потоке, сканирование не прерывается
+                export = partial(
+                    visitor_export.export_rows, self.db_name,
+                    storage.VISITORS_EXPORT_SQL,
+                    ["ФИО", "Организация", "Время посещения", "Мероприятие"], file_path
+                )
+                self.visitors_export_thread = start_export(
+                    self, "Экспорт посетителей...", total, export,
+                    partial(self.on_visitors_exported, file_path), modal=False
+                )
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
+    
+    def export_new_visits(self):
+        """Выгрузка посещений, добавленных после прошлой выгрузки"""
+        if self.visitors_export_thread and self.visitors_export_thread.isRunning():
+            return
+        try:
+            total = storage.count_new_visits(self.conn, "excel")
+            
+            if not total:
+                QMessageBox.information(self, "Нет данных", "Новых посещений с момента прошлой выгрузки нет")
+                return
+            
+            # Можно выбрать существующий файл - новые строки будут дописаны в конец
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "Новый файл или существующий для дополнения",
+                f"visits_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                visitor_export.FILE_FILTER, options=QFileDialog.DontConfirmOverwrite
+            )
+            
+            if file_path:
+                export = partial(visitor_export.export_new_visits, self.db_name, file_path, "excel")
+                self.visitors_export_thread = start_export(
+                    self, "Экспорт новых посещений...", total, export,
+                    partial(self.on_visitors_exported, file_path), modal=False
+                )
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
     
+    def on_visitors_exported(self, file_path, cancelled, error, exported_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", "Экспорт прерван")
+        else:
+            QMessageBox.information(self, "Успешно", f"Экспортировано {exported_count} записей в {file_path}")
+    
     # Методы для режима генерации
     def load_excel_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Выберите файл Excel", "", "Excel Files (*.xlsx *.xls)"
+            self, "Выберите файл Excel или CSV", "", FILE_FILTER
         )
         
         if file_path:
@@ -824,10 +1036,9 @@ class MainApp(QMainWindow):
             self.file_label.setStyleSheet("font-weight: bold; color: #27ae60;")
             
             try:
-                wb = openpyxl.load_workbook(file_path, read_only=True)
+                book = self.workbooks.get(file_path)
                 self.sheet_combo.clear()
-                self.sheet_combo.addItems(wb.sheetnames)
-                wb.close()
+                self.sheet_combo.addItems(book.sheetnames)
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {str(e)}")
     
@@ -840,16 +1051,13 @@ class MainApp(QMainWindow):
         sheet_name = self.sheet_combo.currentText()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
+            headers = self.workbooks.get(self.excel_file).sheet_headers(sheet_name)
             
-            for col_idx, cell in enumerate(sheet[1], 1):
-                if cell.value:
-                    self.column_combo.addItem(str(cell.value), col_idx)
+            for col_idx, value in enumerate(headers, 1):
+                if value:
+                    self.column_combo.addItem(str(value), col_idx)
                 else:
                     self.column_combo.addItem(f"Колонка {col_idx}", col_idx)
-            
-            wb.close()
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать колонки: {str(e)}")
     
@@ -857,61 +1065,58 @@ class MainApp(QMainWindow):
         if not all([self.excel_file, self.sheet_combo.currentText(), self.column_combo.currentText()]):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите файл, лист и колонку")
             return
+        if self.generation_thread and self.generation_thread.isRunning():
+            return
             
         self.data_list.clear()
         self.qr_codes = {}
+        self.qr_pixmaps.clear()
         sheet_name = self.sheet_combo.currentText()
-        column = self.column_combo.currentText()
         col_idx = self.column_combo.currentData()
-        qr_size = self.size_spin.value()
+        self.qr_size = self.size_spin.value()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
-            
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if len(row) >= col_idx:
-                    value = row[col_idx-1]
-                    if value is not None:
-                        value = str(value).strip()
-                        if value:
-                            qr = qrcode.QRCode(
-                                version=1,
-                                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                                box_size=12,
-                                border=4,
-                            )
-                            qr.add_data(value)
-                            qr.make(fit=True)
-                            
-                            img = qr.make_image(fill_color="black", back_color="white")
-                            img = img.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-                            
-                            self.qr_codes[value] = img
-                            self.data_list.addItem(value)
-            
-            wb.close()
-            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+            # Колонка берется из кэша книги, файл повторно не разбирается
+            values = self.workbooks.get(self.excel_file).column(sheet_name, col_idx)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {str(e)}")
+            return
+        
+        # Генерация выполняется пулом процессов, интерфейс остается отзывчивым
+        self.generation_thread = start_generation(
+            self, values, self.add_generated_qr_codes, self.on_generation_finished,
+            error_correction=qrcode.constants.ERROR_CORRECT_H
+        )
+    
+    def add_generated_qr_codes(self, batch):
+        for value, code in batch:
+            # Хранится только компактная матрица, изображение строится по запросу
+            self.qr_codes[value] = code
+            self.data_list.addItem(value)
+    
+    def on_generation_finished(self, cancelled, error):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Генерация прервана, готово {len(self.qr_codes)} QR-кодов")
+        else:
+            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+    
+    def render_qr(self, text):
+        return self.qr_codes[text].render(self.qr_size)
     
     def show_qr_code(self, item):
         text = item.text()
         if text in self.qr_codes:
-            self.current_qr = self.qr_codes[text]
-            
-            img_byte_arr = io.BytesIO()
-            self.current_qr.save(img_byte_arr, format='PNG')
-            qimage = QImage.fromData(img_byte_arr.getvalue())
-            pixmap = QPixmap.fromImage(qimage)
+            self.current_qr = text
             
             display_size = min(self.qr_display.width(), self.qr_display.height()) - 20
-            pixmap = pixmap.scaled(
-                display_size, 
-                display_size,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            pixmap = self.qr_pixmaps.get((text, display_size))
+            if pixmap is None:
+                # Код рисуется сразу в размере области просмотра, без масштабирования
+                img = self.qr_codes[text].render(display_size)
+                pixmap = QPixmap.fromImage(pil_to_qimage(img))
+                self.qr_pixmaps.put((text, display_size), pixmap)
             
             self.qr_display.setPixmap(pixmap)
     
@@ -931,7 +1136,7 @@ class MainApp(QMainWindow):
         
         if file_path:
             try:
-                self.current_qr.save(file_path)
+                self.render_qr(self.current_qr).save(file_path)
                 QMessageBox.information(self, "Успешно", "QR-код сохранен")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
@@ -940,30 +1145,72 @@ class MainApp(QMainWindow):
         if not self.qr_codes:
             QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
             return
+        if self.export_thread and self.export_thread.isRunning():
+            return
             
         dir_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
         
         if dir_path:
-            try:
-                saved_count = 0
-                for text, img in self.qr_codes.items():
-                    safe_text = "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip()
-                    file_path = os.path.join(dir_path, f"{safe_text}.png")
-                    img.save(file_path)
-                    saved_count += 1
-                
-                QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {str(e)}")
+            # PNG кодируются пулом процессов в фоновом потоке
+            items = list(self.qr_codes.items())
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items),
+                partial(qr_export.export_png_files, items, dir_path, self.qr_size),
+                self.on_export_finished
+            )
+    
+    def save_qr_archive(self):
+        if not self.qr_codes:
+            QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
+            return
+        if self.export_thread and self.export_thread.isRunning():
+            return
+        
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить в один файл", "qr_codes.zip",
+            "ZIP-архив (*.zip);;PDF для печати (*.pdf)"
+        )
+        
+        if file_path:
+            items = list(self.qr_codes.items())
+            if file_path.lower().endswith(".pdf") or (
+                    "pdf" in selected_filter and not file_path.lower().endswith(".zip")):
+                # Листы A4 по 24 кода, запись идет постранично
+                export = partial(qr_export.export_pdf, items, file_path)
+            else:
+                export = partial(qr_export.export_zip, items, file_path, self.qr_size)
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items), export, self.on_export_finished
+            )
+    
+    def on_export_finished(self, cancelled, error, saved_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Сохранение прервано, сохранено {saved_count} QR-кодов")
+        else:
+            QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
     
     def closeEvent(self, event):
-        if self.camera and self.camera.isOpened():
-            self.camera.release()
+        if self.camera_discovery:
+            # Поиск ограничен таймаутом, зависшие драйверы не задерживают выход
+            self.camera_discovery.wait()
+        for scanner in self.scanners.values():
+            scanner.stop()
+        if hasattr(self, 'writer'):
+            # Дописываем посещения, оставшиеся в очереди
+            self.writer.stop()
+        for thread in (self.generation_thread, self.export_thread, self.visitors_export_thread):
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
         if hasattr(self, 'conn'):
             self.conn.close()
+        self.workbooks.clear()
         event.accept()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainApp()
     window.show()
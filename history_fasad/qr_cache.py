@@ -0,0 +1,186 @@
+import hashlib
+import os
+import sqlite3
+import time
+from functools import partial
+
+import qrcode
+
+import qr_engine
+
+# Кэш хранится между запусками и общий для окон генератора и qr_batch.py
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".historical_facade_qr_cache.db")
+# Наибольший объем кэша; сверх него удаляются давно не использованные записи
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Количество ключей в одном запросе IN (...)
+LOOKUP_CHUNK = 500
+
+
+def cache_key(*parts):
+    """Ключ по содержимому: хэш всех параметров, от которых зависит результат"""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class QRCache:
+    """Дисковый кэш готовых QR-кодов (SQLite) с вытеснением LRU по объему.
+
+    Кэш необязателен: ошибки базы (файл занят, поврежден, нет доступа)
+    не прерывают генерацию, а только отключают повторное использование.
+    Соединение принадлежит потоку, в котором кэш открыт.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+        self.conn.commit()
+
+    def existing(self, keys):
+        """Ключи, для которых в кэше есть записи (сами данные не читаются)"""
+        keys = list(dict.fromkeys(keys))
+        found = set()
+        try:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(key for key, in self.conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", chunk
+                ))
+        except sqlite3.Error:
+            pass
+        return found
+
+    def get_many(self, keys):
+        """Найденные записи в виде словаря ключ -> данные"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        try:
+            with self.conn:
+                for start in range(0, len(keys), LOOKUP_CHUNK):
+                    chunk = keys[start:start + LOOKUP_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    found.update(self.conn.execute(
+                        f"SELECT key, data FROM entries WHERE key IN ({placeholders})", chunk
+                    ))
+                # Отметка использования для вытеснения LRU
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+        except sqlite3.Error:
+            pass
+        return found
+
+    def put_many(self, items):
+        """Сохранение пар (ключ, данные) с вытеснением старых записей"""
+        if not items:
+            return
+        now = time.time()
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                    [(key, data, len(data), now) for key, data in items]
+                )
+                self.evict()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Удаление давно не использованных записей сверх max_bytes"""
+        excess = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_cache(path=CACHE_FILE, max_bytes=MAX_CACHE_BYTES):
+    """Открытие кэша (None, если база недоступна - генерация идет без кэша)"""
+    try:
+        return QRCache(path, max_bytes)
+    except sqlite3.Error:
+        return None
+
+
+def cached_batch(values, task, key, cache, workers=None, cancel_event=None, dumps=bytes, loads=bytes):
+    """qr_engine.generate_batch с дисковым кэшем.
+
+    Результаты для найденных ключей берутся из кэша, пулу процессов
+    отдаются только остальные значения. dumps и loads переводят результат
+    task в байты и обратно. Возвращает пары (значение, результат) в
+    исходном порядке.
+
+    Записи читаются из кэша и сохраняются в него порциями по LOOKUP_CHUNK
+    по мере выдачи, поэтому расход памяти не зависит от длины списка.
+    """
+    values = list(values)
+    if cache is None:
+        yield from qr_engine.generate_batch(values, task, workers, cancel_event)
+        return
+
+    keys = [key(value) for value in values]
+    cached = cache.existing(keys)
+    missing = [value for value, value_key in zip(values, keys) if value_key not in cached]
+    computed = qr_engine.generate_batch(missing, task, workers, cancel_event)
+    loaded = {}
+    new_items = []
+    try:
+        for index, (value, value_key) in enumerate(zip(values, keys)):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if value_key in cached:
+                if value_key not in loaded:
+                    # Следующая порция готовых результатов
+                    loaded = cache.get_many(
+                        [k for k in keys[index:index + LOOKUP_CHUNK] if k in cached]
+                    )
+                data = loaded.get(value_key)
+                if data is not None:
+                    yield value, loads(data)
+                    continue
+                # Запись успели вытеснить - строим заново
+                result = task(value)
+            else:
+                item = next(computed, None)
+                if item is None:
+                    # Генерация отменена
+                    return
+                result = item[1]
+            new_items.append((value_key, dumps(result)))
+            if len(new_items) >= LOOKUP_CHUNK:
+                cache.put_many(new_items)
+                new_items = []
+            yield value, result
+    finally:
+        computed.close()
+        cache.put_many(new_items)
+
+
+def generate_codes(values, cache, workers=None, cancel_event=None,
+                   error_correction=qrcode.constants.ERROR_CORRECT_H, border=4):
+    """Кодирование значений в компактные матрицы (qr_engine.PackedQR) через кэш"""
+    return cached_batch(
+        values, partial(qr_engine.make_qr_code, error_correction=error_correction, border=border),
+        lambda value: cache_key("code", value, error_correction, border), cache, workers, cancel_event,
+        qr_engine.PackedQR.to_bytes, qr_engine.PackedQR.from_bytes
+    )
+
@@ -0,0 +1,156 @@
+import os
+from collections import OrderedDict, deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import qrcode
+from PIL import Image, ImageColor
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Для небольших списков запуск пула процессов дороже самой генерации
+PARALLEL_THRESHOLD = 64
+
+
+def make_qr_matrix(value, error_correction=qrcode.constants.ERROR_CORRECT_H, border=4):
+    """Матрица модулей QR-кода вместе с полем (True - темный модуль)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=error_correction,
+        border=border,
+    )
+    qr.add_data(value)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def render_matrix(matrix, size, fill_color="black", back_color="white"):
+    """Отрисовка матрицы сразу в нужном размере без масштабирования.
+
+    Размер модуля - целое число пикселей, остаток распределяется по краям
+    поля, поэтому границы модулей остаются четкими. Черно-белый код
+    сохраняется в 1-битном изображении, цветной - в палитровом.
+    """
+    modules = matrix.shape[0]
+    module_px = max(1, size // modules)
+    size = max(size, modules * module_px)
+    offset = (size - modules * module_px) // 2
+
+    pixels = np.zeros((size, size), dtype=bool)
+    scaled = np.repeat(np.repeat(matrix, module_px, axis=0), module_px, axis=1)
+    pixels[offset:offset + scaled.shape[0], offset:offset + scaled.shape[1]] = scaled
+
+    fill = ImageColor.getrgb(fill_color)
+    back = ImageColor.getrgb(back_color)
+    if fill == (0, 0, 0) and back == (255, 255, 255):
+        return Image.fromarray(~pixels)
+
+    img = Image.fromarray(pixels.astype(np.uint8), mode="P")
+    img.putpalette(back[:3] + fill[:3])
+    return img
+
+
+class PackedQR:
+    """Компактное хранение QR-кода: матрица модулей, упакованная по биту на модуль.
+
+    Изображение строится только при отображении или сохранении.
+    """
+    __slots__ = ("modules", "bits")
+
+    def __init__(self, matrix):
+        self.modules = matrix.shape[0]
+        self.bits = np.packbits(matrix).tobytes()
+
+    def unpack(self):
+        bits = np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8), count=self.modules * self.modules)
+        return bits.reshape(self.modules, self.modules).astype(bool)
+
+    def render(self, size, fill_color="black", back_color="white"):
+        return render_matrix(self.unpack(), size, fill_color, back_color)
+
+    def to_bytes(self):
+        """Сериализация для дискового кэша: размер матрицы (2 байта) и биты модулей"""
+        return self.modules.to_bytes(2, "big") + self.bits
+
+    @classmethod
+    def from_bytes(cls, data):
+        code = cls.__new__(cls)
+        code.modules = int.from_bytes(data[:2], "big")
+        code.bits = bytes(data[2:])
+        return code
+
+
+def make_qr_code(value, error_correction=qrcode.constants.ERROR_CORRECT_H, border=4):
+    """Кодирование значения в компактную матрицу"""
+    return PackedQR(make_qr_matrix(value, error_correction, border))
+
+
+class LRUCache:
+    """Ограниченный кэш с вытеснением давно не использованных записей"""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+        return item
+
+    def put(self, key, item):
+        self.items[key] = item
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+def generate_batch(values, task=make_qr_code, workers=None, cancel_event=None):
+    """Генерация QR-кодов для последовательности значений.
+
+    values может быть любым итерируемым объектом, в том числе генератором
+    чтения таблицы. Значения раздаются пулу процессов, результаты task
+    (по умолчанию - компактные матрицы) возвращаются в исходном порядке как
+    пары (значение, результат). task должна быть доступна из дочернего
+    процесса (функция модуля или functools.partial от нее).
+    Генерация прекращается, если установлен cancel_event.
+    """
+    # Для генератора длина заранее неизвестна
+    total = len(values) if hasattr(values, "__len__") else None
+    values = iter(values)
+    head = list(islice(values, PARALLEL_THRESHOLD))
+
+    if len(head) < PARALLEL_THRESHOLD or workers == 1:
+        for value in chain(head, values):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield value, task(value)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, total // (workers * 8))) if total else 16
+    # Значения, отданные пулу, запоминаются для сопоставления с результатами
+    pending = deque()
+
+    def feed():
+        for value in chain(head, values):
+            pending.append(value)
+            yield value
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for result in executor.map(task, feed(), chunksize=chunksize):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield pending.popleft(), result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
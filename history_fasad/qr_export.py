@@ -0,0 +1,308 @@
+import io
+import os
+import zipfile
+import zlib
+from functools import partial
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+import qr_cache
+
+# Размер буфера записи: файлы пишутся крупными блоками, а не по мелким кускам
+WRITE_BUFFER = 1024 * 1024
+# Шрифты с кириллицей для подписей в PDF: Windows, затем Linux
+CAPTION_FONTS = ("arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+# Подпись рисуется растром с таким числом пикселей на пункт
+CAPTION_SCALE = 4
+
+
+def safe_filename(text):
+    """Очистка имени файла от недопустимых символов"""
+    safe_text = "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip()
+    return safe_text or "qr"
+
+
+def unique_filenames(texts, extension=".png"):
+    """Имена файлов без совпадений.
+
+    Если два значения дают одинаковое имя, ко второму и следующим
+    добавляется номер " (2)", " (3)"... в порядке следования значений,
+    поэтому результат не зависит от запуска. Сравнение без учета регистра,
+    как в файловой системе Windows.
+    """
+    used = set()
+    names = []
+    for text in texts:
+        base = safe_filename(text)
+        name = base + extension
+        number = 2
+        while name.lower() in used:
+            name = f"{base} ({number}){extension}"
+            number += 1
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def encode_png(code, size, fill_color="black", back_color="white"):
+    """Отрисовка и кодирование QR-кода в PNG (выполняется в дочернем процессе)"""
+    buffer = io.BytesIO()
+    code.render(size, fill_color, back_color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def encode_pngs(codes, size, workers=None, cancel_event=None, fill_color="black", back_color="white",
+                use_cache=True):
+    """PNG для списка кодов: готовые берутся из дискового кэша, остальные кодируются пулом.
+
+    Ключ кэша строится по самой матрице, размеру и цветам, поэтому
+    одинаковые коды из разных списков кодируются один раз.
+    """
+    cache = qr_cache.open_cache() if use_cache else None
+    try:
+        yield from qr_cache.cached_batch(
+            codes, partial(encode_png, size=size, fill_color=fill_color, back_color=back_color),
+            lambda code: qr_cache.cache_key("png", code.modules, code.bits, size, fill_color, back_color),
+            cache, workers, cancel_event
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def export_png_files(items, dir_path, size, workers=None, cancel_event=None, progress=None, **options):
+    """Сохранение QR-кодов в отдельные PNG-файлы.
+
+    items - пары (значение, qr_engine.PackedQR). PNG берутся из кэша или
+    кодируются пулом процессов, запись на диск идет последовательно в этом потоке.
+    progress(готово, всего) вызывается после каждого файла.
+    Возвращает количество сохраненных файлов.
+    """
+    items = list(items)
+    names = unique_filenames(text for text, _ in items)
+    codes = [code for _, code in items]
+
+    saved_count = 0
+    for (_, data), name in zip(encode_pngs(codes, size, workers, cancel_event, **options), names):
+        with open(os.path.join(dir_path, name), "wb", buffering=WRITE_BUFFER) as f:
+            f.write(data)
+        saved_count += 1
+        if progress is not None:
+            progress(saved_count, len(items))
+    return saved_count
+
+
+def export_zip(items, file_path, size, workers=None, cancel_event=None, progress=None, **options):
+    """Сохранение всех QR-кодов в один ZIP-архив.
+
+    PNG уже сжаты, поэтому архив пишется без повторного сжатия (ZIP_STORED).
+    Изображения кодируются пулом процессов и сразу дописываются в архив,
+    в памяти одновременно находится только очередь готовых PNG.
+    """
+    items = list(items)
+    names = unique_filenames(text for text, _ in items)
+    codes = [code for _, code in items]
+
+    saved_count = 0
+    with open(file_path, "wb", buffering=WRITE_BUFFER) as f, \
+            zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as archive:
+        for (_, data), name in zip(encode_pngs(codes, size, workers, cancel_event, **options), names):
+            archive.writestr(name, data)
+            saved_count += 1
+            if progress is not None:
+                progress(saved_count, len(items))
+    if cancel_event is not None and cancel_event.is_set():
+        os.remove(file_path)
+    return saved_count
+
+
+def caption_font(size):
+    for name in CAPTION_FONTS:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def wrap_caption(draw, text, font, width, max_lines=2):
+    """Разбиение подписи на строки по ширине; ";" в данных QR-кода - перенос строки"""
+    lines = []
+    for part in text.split(";"):
+        line = ""
+        for word in part.split():
+            candidate = f"{line} {word}".strip()
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        if line:
+            lines.append(line)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += "…"
+    result = []
+    for line in lines:
+        while len(line) > 1 and draw.textlength(line, font=font) > width:
+            line = line[:-2] + "…"
+        result.append(line)
+    return result
+
+
+class PdfSheetWriter:
+    """Потоковая запись листов с QR-кодами в PDF (N кодов на странице).
+
+    Каждый код хранится в PDF как изображение размером в матрицу модулей
+    (1 бит на модуль) и масштабируется при печати без сглаживания, поэтому
+    файл получается маленьким, а края модулей - четкими. Подпись под кодом
+    (значение из таблицы) - отдельное 1-битное изображение: стандартные
+    шрифты PDF не содержат кириллицы. Страница записывается в файл, как
+    только заполнена.
+    """
+    # A4 в пунктах
+    PAGE_SIZE = (595, 842)
+
+    def __init__(self, f, columns=4, rows=6, margin=36, fill_color="black", back_color="white"):
+        self.f = f
+        self.columns = columns
+        self.rows = rows
+        self.margin = margin
+        self.offsets = {}
+        self.page_ids = []
+        self.pending = []
+        # 1 - каталог, 2 - дерево страниц, записываются в конце
+        self.next_id = 3
+        fill = ImageColor.getrgb(fill_color)[:3]
+        back = ImageColor.getrgb(back_color)[:3]
+        self.palette = bytes(back + fill).hex()
+        width, height = self.PAGE_SIZE
+        self.cell_w = (width - 2 * margin) / columns
+        self.cell_h = (height - 2 * margin) / rows
+        # Под подпись отводится полоса высотой в две строки
+        self.caption_w = self.cell_w * 0.95
+        self.caption_h = min(24.0, self.cell_h * 0.2)
+        self.font = caption_font(int(self.caption_h * CAPTION_SCALE * 0.4))
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def write_object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(f"{obj_id} 0 obj\n".encode())
+        if stream is None:
+            self.f.write(body.encode() + b"\nendobj\n")
+        else:
+            self.f.write(f"{body[:-2]} /Length {len(stream)} >>\nstream\n".encode())
+            self.f.write(stream + b"\nendstream\nendobj\n")
+
+    def add(self, matrix, caption=None):
+        self.pending.append((matrix, caption))
+        if len(self.pending) == self.columns * self.rows:
+            self.flush_page()
+
+    def render_caption(self, text):
+        """Подпись в виде 1-битного изображения: 1 - цвет кода, 0 - фон"""
+        width = int(self.caption_w * CAPTION_SCALE)
+        height = int(self.caption_h * CAPTION_SCALE)
+        img = Image.new("L", (width, height), 0)
+        draw = ImageDraw.Draw(img)
+        lines = wrap_caption(draw, text, self.font, width)
+        line_h = height / 2
+        top = (height - line_h * len(lines)) / 2
+        for index, line in enumerate(lines):
+            draw.text((width / 2, top + line_h * (index + 0.5)), line, fill=255, font=self.font, anchor="mm")
+        # Порог без сглаживания: края букв остаются четкими при печати
+        return img.point(lambda value: 255 if value >= 128 else 0, "1")
+
+    def write_image(self, width, height, data):
+        image_id = self.allocate()
+        self.write_object(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace [/Indexed /DeviceRGB 1 <{self.palette}>] /BitsPerComponent 1 "
+            "/Interpolate false /Filter /FlateDecode >>"
+        ), zlib.compress(data))
+        return image_id
+
+    def flush_page(self):
+        if not self.pending:
+            return
+        width, height = self.PAGE_SIZE
+        cell_w, cell_h = self.cell_w, self.cell_h
+        side = min(cell_w, cell_h - self.caption_h) * 0.9
+
+        images = []
+        commands = []
+        for position, (matrix, caption) in enumerate(self.pending):
+            modules = matrix.shape[0]
+            image_id = self.write_image(modules, modules, np.packbits(matrix, axis=1).tobytes())
+            images.append(f"/Im{position} {image_id} 0 R")
+
+            # Код и подпись под ним центрируются в ячейке
+            column, row = position % self.columns, position // self.columns
+            block_h = side + (self.caption_h if caption else 0)
+            x = self.margin + column * cell_w + (cell_w - side) / 2
+            y = height - self.margin - row * cell_h - (cell_h - block_h) / 2 - side
+            commands.append(f"q {side:.2f} 0 0 {side:.2f} {x:.2f} {y:.2f} cm /Im{position} Do Q")
+
+            if caption:
+                strip = self.render_caption(str(caption))
+                caption_id = self.write_image(strip.width, strip.height, strip.tobytes())
+                images.append(f"/Cap{position} {caption_id} 0 R")
+                caption_x = self.margin + column * cell_w + (cell_w - self.caption_w) / 2
+                commands.append(
+                    f"q {self.caption_w:.2f} 0 0 {self.caption_h:.2f} {caption_x:.2f} "
+                    f"{y - self.caption_h:.2f} cm /Cap{position} Do Q"
+                )
+
+        content_id = self.allocate()
+        self.write_object(content_id, "<< /Filter /FlateDecode >>", zlib.compress("\n".join(commands).encode()))
+        page_id = self.allocate()
+        self.write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Resources << /XObject << {' '.join(images)} >> >> /Contents {content_id} 0 R >>"
+        ))
+        self.page_ids.append(page_id)
+        self.pending = []
+
+    def close(self):
+        self.flush_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self.f.tell()
+        self.f.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self.next_id):
+            self.f.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode())
+        self.f.write((
+            f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n"
+        ).encode())
+
+
+def export_pdf(items, file_path, columns=4, rows=6, cancel_event=None, progress=None, **options):
+    """Сохранение всех QR-кодов в один многостраничный PDF для печати.
+
+    Под каждым кодом печатается его значение, чтобы код можно было
+    сопоставить с гостем.
+    """
+    items = list(items)
+    saved_count = 0
+    with open(file_path, "wb", buffering=WRITE_BUFFER) as f:
+        writer = PdfSheetWriter(f, columns, rows, **options)
+        for value, code in items:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            writer.add(code.unpack(), value)
+            saved_count += 1
+            if progress is not None:
+                progress(saved_count, len(items))
+        writer.close()
+    if cancel_event is not None and cancel_event.is_set():
+        os.remove(file_path)
+    return saved_count
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtWidgets import QProgressDialog
+
+import qr_cache
+
+
+class GenerationThread(QThread):
+    """Фоновая генерация QR-кодов с передачей результатов пачками.
+
+    Коды, уже построенные с теми же параметрами, берутся из дискового кэша.
+    """
+    batch_ready = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    # Готовые коды передаются в GUI не чаще, чем раз в BATCH_INTERVAL секунд
+    BATCH_INTERVAL = 0.1
+
+    def __init__(self, values, options, parent=None):
+        super().__init__(parent)
+        self.values = list(values)
+        self.options = options
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        total = len(self.values)
+        done = 0
+        batch = []
+        last_emit = time.monotonic()
+        # Соединение с кэшем открывается в потоке генерации
+        cache = qr_cache.open_cache()
+        try:
+            for value, code in qr_cache.generate_codes(
+                self.values, cache, cancel_event=self.cancel_event, **self.options
+            ):
+                batch.append((value, code))
+                done += 1
+                now = time.monotonic()
+                if now - last_emit >= self.BATCH_INTERVAL:
+                    self.batch_ready.emit(batch)
+                    self.progress.emit(done, total)
+                    batch = []
+                    last_emit = now
+            if batch:
+                self.batch_ready.emit(batch)
+            self.progress.emit(done, total)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if cache is not None:
+                cache.close()
+
+
+class ExportThread(QThread):
+    """Фоновое выполнение экспорта с отчетом о прогрессе"""
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, export, parent=None):
+        super().__init__(parent)
+        self.export = export
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.last_report = 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def report(self, done, total):
+        # Прогресс передается в GUI не чаще, чем раз в 50 мс
+        now = time.monotonic()
+        if done == total or now - self.last_report >= 0.05:
+            self.last_report = now
+            self.progress.emit(done, total)
+
+    def run(self):
+        try:
+            self.result = self.export(cancel_event=self.cancel_event, progress=self.report)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+def run_with_progress(parent, thread, label, total, on_finished, modal=True):
+    """Окно прогресса с кнопкой отмены для фонового потока.
+
+    on_finished получает признак отмены и текст ошибки (или None).
+    Немодальное окно не блокирует работу с главным окном.
+    """
+    dialog = QProgressDialog(label, "Отмена", 0, total, parent)
+    dialog.setWindowTitle("Выполнение")
+    dialog.setWindowModality(Qt.WindowModal if modal else Qt.NonModal)
+    dialog.setMinimumDuration(300)
+    errors = []
+
+    def finish():
+        cancelled = thread.cancel_event.is_set()
+        # Закрытие QProgressDialog само по себе вызывает сигнал canceled
+        dialog.canceled.disconnect(thread.cancel)
+        dialog.close()
+        on_finished(cancelled, errors[0] if errors else None)
+
+    dialog.canceled.connect(thread.cancel)
+    thread.progress.connect(lambda done, total: dialog.setValue(done))
+    thread.failed.connect(errors.append)
+    thread.finished.connect(finish)
+    thread.start()
+    return thread
+
+
+def start_generation(parent, values, on_batch, on_finished, **options):
+    """Запуск фоновой генерации с окном прогресса и кнопкой отмены.
+
+    on_batch получает список пар (значение, qr_engine.PackedQR),
+    on_finished - признак отмены и текст ошибки (или None).
+    """
+    thread = GenerationThread(values, options, parent)
+    thread.batch_ready.connect(on_batch)
+    return run_with_progress(parent, thread, "Генерация QR-кодов...", len(thread.values), on_finished)
+
+
+def start_export(parent, label, total, export, on_finished, modal=True):
+    """Запуск фонового экспорта.
+
+    export вызывается с аргументами cancel_event и progress и возвращает
+    количество сохраненных записей; on_finished получает признак отмены,
+    текст ошибки (или None) и это количество.
+    """
+    thread = ExportThread(export, parent)
+    return run_with_progress(
+        parent, thread, label, total,
+        lambda cancelled, error: on_finished(cancelled, error, thread.result or 0),
+        modal
+    )
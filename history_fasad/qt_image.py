@@ -0,0 +1,33 @@
+from PyQt5.QtGui import QImage, qRgb
+
+
+def pil_to_qimage(img):
+    """Преобразование PIL.Image в QImage без промежуточного кодирования в PNG.
+
+    QImage создается поверх байтов изображения с явным шагом строки
+    (PIL хранит строки без выравнивания), формат выбирается по режиму
+    изображения. Буфер сохраняется в атрибуте QImage, чтобы не был
+    освобожден раньше времени.
+    """
+    if img.mode not in ("1", "L", "P", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+
+    width, height = img.size
+    data = img.tobytes()
+
+    if img.mode == "1":
+        qimage = QImage(data, width, height, (width + 7) // 8, QImage.Format_Mono)
+        qimage.setColorTable([qRgb(0, 0, 0), qRgb(255, 255, 255)])
+    elif img.mode == "L":
+        qimage = QImage(data, width, height, width, QImage.Format_Grayscale8)
+    elif img.mode == "P":
+        qimage = QImage(data, width, height, width, QImage.Format_Indexed8)
+        palette = img.getpalette()[:768]
+        qimage.setColorTable([qRgb(*palette[i:i + 3]) for i in range(0, len(palette), 3)])
+    elif img.mode == "RGB":
+        qimage = QImage(data, width, height, width * 3, QImage.Format_RGB888)
+    else:
+        qimage = QImage(data, width, height, width * 4, QImage.Format_RGBA8888)
+
+    qimage.buffer = data
+    return qimage
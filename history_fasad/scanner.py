@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+from pyzbar.pyzbar import decode
+import cv2
+
+# Ширина кадра для быстрого прохода распознавания
+DECODE_WIDTH = 640
+# Полноразмерный проход выполняется не чаще чем на каждом N-м пустом кадре
+FULL_PASS_INTERVAL = 3
+# Пауза (сек), в течение которой повторное считывание того же QR-кода игнорируется
+SCAN_COOLDOWN = 5.0
+# Пауза (сек) после неудачного чтения кадра, чтобы зависшая камера не занимала ядро
+READ_RETRY_DELAY = 0.02
+# Столько неудачных чтений подряд (около 2 сек) считаются отключением камеры
+MAX_READ_FAILURES = 100
+
+class FrameQueue:
+    """Ограниченная очередь кадров: при переполнении выбрасывается самый старый кадр"""
+
+    def __init__(self, maxsize=2):
+        self.frames = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, frame):
+        with self.condition:
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def get(self, timeout=0.1):
+        with self.condition:
+            if not self.frames and not self.closed:
+                self.condition.wait(timeout)
+            if self.frames:
+                return self.frames.popleft()
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.condition.notify_all()
+
+
+class ScanDebouncer:
+    """Кэш недавно считанных QR-кодов (TTL + LRU).
+
+    Пока код остается в кадре, время последнего считывания продлевается,
+    поэтому удерживаемый перед камерой бейдж обрабатывается один раз.
+    """
+
+    def __init__(self, cooldown=SCAN_COOLDOWN, max_size=1024):
+        self.cooldown = cooldown
+        self.max_size = max_size
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+
+    def accept(self, qr_data, now=None):
+        """Возвращает True, если код нужно обработать"""
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            last_seen = self.seen.pop(qr_data, None)
+            self.seen[qr_data] = now
+            if len(self.seen) > self.max_size:
+                self.seen.popitem(last=False)
+            return last_seen is None or now - last_seen >= self.cooldown
+
+    def clear(self):
+        with self.lock:
+            self.seen.clear()
+
+
+class FrameDecoder:
+    """Распознавание QR-кода: быстрый проход по уменьшенной области интереса
+    в оттенках серого, проход по той же области в полном разрешении только
+    если быстрый ничего не нашел.
+
+    roi задается долями кадра (x, y, ширина, высота), None - весь кадр.
+    """
+
+    def __init__(self, roi=None, decode_width=DECODE_WIDTH, full_pass_interval=FULL_PASS_INTERVAL):
+        self.roi = roi
+        self.decode_width = decode_width
+        self.full_pass_interval = full_pass_interval
+        self.missed = 0
+
+    def crop(self, gray):
+        if not self.roi:
+            return gray
+        h, w = gray.shape
+        x, y, rw, rh = self.roi
+        left, top = int(x * w), int(y * h)
+        right, bottom = min(w, left + int(rw * w)), min(h, top + int(rh * h))
+        if right <= left or bottom <= top:
+            return gray
+        return gray[top:bottom, left:right]
+
+    def decode(self, frame):
+        # Перевод в оттенки серого выполняется один раз на кадр
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        cropped = self.crop(gray)
+        region = cropped
+        h, w = region.shape
+        if w > self.decode_width:
+            scale = self.decode_width / w
+            region = cv2.resize(region, (self.decode_width, max(1, int(h * scale))),
+                                interpolation=cv2.INTER_AREA)
+
+        decoded_objects = decode(region)
+        if decoded_objects:
+            self.missed = 0
+            return decoded_objects
+
+        # Быстрый проход ничего не нашел - та же область в полном разрешении
+        if region is cropped:
+            return decoded_objects
+        self.missed += 1
+        if self.missed < self.full_pass_interval:
+            return decoded_objects
+        self.missed = 0
+        return decode(cropped)
+
+
+class CaptureThread(QThread):
+    """Поток захвата кадров с камеры"""
+    frame_ready = pyqtSignal(QImage)
+    failed = pyqtSignal(str)
+
+    def __init__(self, camera_index, frames, parent=None):
+        super().__init__(parent)
+        self.camera_index = camera_index
+        self.frames = frames
+        # Предпросмотр не отправляется, пока GUI не отрисовал предыдущий кадр
+        self.preview_pending = False
+
+    def run(self):
+        camera = cv2.VideoCapture(self.camera_index)
+        if not camera.isOpened():
+            self.failed.emit("Не удалось открыть камеру!")
+            return
+
+        try:
+            failures = 0
+            while not self.isInterruptionRequested():
+                ret, frame = camera.read()
+                if not ret:
+                    failures += 1
+                    if failures >= MAX_READ_FAILURES:
+                        self.failed.emit("Камера не отвечает. Проверьте подключение.")
+                        return
+                    time.sleep(READ_RETRY_DELAY)
+                    continue
+                failures = 0
+
+                self.frames.put(frame)
+
+                if not self.preview_pending:
+                    self.preview_pending = True
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    h, w, ch = frame_rgb.shape
+                    q_img = QImage(frame_rgb.data, w, h, ch * w, QImage.Format_RGB888)
+                    # copy() отвязывает QImage от буфера numpy перед передачей в GUI
+                    self.frame_ready.emit(q_img.copy())
+        finally:
+            camera.release()
+
+
+class DecodeThread(QThread):
+    """Поток распознавания QR-кодов из очереди кадров"""
+    qr_detected = pyqtSignal(str)
+
+    def __init__(self, frames, decoder, debouncer=None, parent=None):
+        super().__init__(parent)
+        self.frames = frames
+        self.decoder = decoder
+        self.debouncer = debouncer
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            frame = self.frames.get()
+            if frame is None:
+                continue
+
+            decoded_objects = self.decoder.decode(frame)
+            if decoded_objects:
+                qr_data = decoded_objects[0].data.decode('utf-8')
+                # Повторные считывания не доходят до базы данных и интерфейса
+                if self.debouncer is None or self.debouncer.accept(qr_data):
+                    self.qr_detected.emit(qr_data)
+
+
+class CameraScanner(QObject):
+    """Сканер QR-кодов: захват и распознавание выполняются вне GUI-потока"""
+    frame_ready = pyqtSignal(QImage)
+    qr_detected = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, camera_index, decoder=None, debouncer=None, parent=None):
+        super().__init__(parent)
+        self.frames = FrameQueue(maxsize=2)
+        self.capture_thread = CaptureThread(camera_index, self.frames)
+        self.decode_thread = DecodeThread(self.frames, decoder or FrameDecoder(), debouncer)
+
+        self.capture_thread.frame_ready.connect(self.on_frame_ready)
+        self.capture_thread.failed.connect(self.failed)
+        self.decode_thread.qr_detected.connect(self.qr_detected)
+
+    def on_frame_ready(self, q_img):
+        self.capture_thread.preview_pending = False
+        self.frame_ready.emit(q_img)
+
+    def start(self):
+        self.capture_thread.start()
+        self.decode_thread.start()
+
+    def stop(self):
+        self.capture_thread.requestInterruption()
+        self.decode_thread.requestInterruption()
+        self.frames.close()
+        self.capture_thread.wait()
+        self.decode_thread.wait()
@@ -0,0 +1,359 @@
+import sqlite3
+from datetime import datetime
+
+# Версия схемы (PRAGMA user_version): 1 - время хранится в секундах Unix
+SCHEMA_VERSION = 1
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def local_time_sql(column):
+    """Выражение SQL: время в секундах Unix как строка местного времени"""
+    return f"datetime({column}, 'unixepoch', 'localtime')"
+
+
+def epoch_sql(column):
+    """Выражение SQL: время из старой базы (строка местного времени) в секундах Unix"""
+    return (
+        f"CASE WHEN typeof({column}) = 'text' "
+        f"THEN CAST(strftime('%s', {column}, 'utc') AS INTEGER) ELSE {column} END"
+    )
+
+
+# Постоянные тексты запросов: sqlite3 кэширует подготовленные выражения
+# по тексту SQL, поэтому при каждом скане компиляция не повторяется
+CHECK_IN_SQL = (
+    "INSERT INTO visitors (full_name, organization, qr_data, visit_time, event) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(qr_data) DO UPDATE SET "
+    "visit_time=excluded.visit_time, event=excluded.event, scan_count=scan_count + 1 "
+    "RETURNING id, full_name, organization, scan_count"
+)
+# Журнал посещений только дополняется: каждый скан - отдельная строка
+VISIT_SQL = "INSERT INTO visits (visitor_id, ts, event, station) VALUES (?, ?, ?, ?)"
+# Посещения в диапазоне id (после отметки прошлой выгрузки)
+NEW_VISITS_SQL = (
+    f"SELECT visitors.full_name, visitors.organization, {local_time_sql('visits.ts')}, "
+    "visits.event, visits.station "
+    "FROM visits JOIN visitors ON visitors.id = visits.visitor_id "
+    "WHERE visits.id > ? AND visits.id <= ? ORDER BY visits.id"
+)
+# Выгрузка журнала посетителей
+VISITORS_EXPORT_SQL = (
+    f"SELECT full_name, organization, {local_time_sql('visit_time')}, event FROM visitors"
+)
+# Объединение с подключенной базой src: посетители сводятся по qr_data,
+# последним посещением остается самое позднее
+MERGE_VISITORS_SQL = (
+    "INSERT INTO visitors (full_name, organization, qr_data, visit_time, event) "
+    f"SELECT full_name, organization, qr_data, {epoch_sql('visit_time')}, event FROM src.visitors WHERE true "
+    "ON CONFLICT(qr_data) DO UPDATE SET visit_time=excluded.visit_time, event=excluded.event "
+    "WHERE excluded.visit_time > visitors.visit_time"
+)
+# Посещения переносятся без повторов, поэтому базу можно объединять повторно
+MERGE_VISITS_SQL = (
+    "INSERT INTO visits (visitor_id, ts, event, station) "
+    "SELECT visitors.id, s.ts, s.event, s.station FROM "
+    f"(SELECT visitor_id, {epoch_sql('ts')} AS ts, event, station FROM src.visits) s "
+    "JOIN src.visitors sv ON sv.id = s.visitor_id "
+    "JOIN visitors ON visitors.qr_data = sv.qr_data "
+    "WHERE NOT EXISTS (SELECT 1 FROM visits m WHERE m.visitor_id = visitors.id "
+    "AND m.ts = s.ts AND m.event IS s.event AND m.station IS s.station)"
+)
+# В базах без журнала visits известно только последнее посещение
+MERGE_LAST_VISITS_SQL = (
+    "INSERT INTO visits (visitor_id, ts, event) "
+    "SELECT visitors.id, s.visit_time, s.event FROM "
+    f"(SELECT qr_data, {epoch_sql('visit_time')} AS visit_time, event FROM src.visitors) s "
+    "JOIN visitors ON visitors.qr_data = s.qr_data "
+    "WHERE s.visit_time IS NOT NULL AND NOT EXISTS (SELECT 1 FROM visits m "
+    "WHERE m.visitor_id = visitors.id AND m.ts = s.visit_time AND m.event IS s.event)"
+)
+MERGE_SCAN_COUNT_SQL = (
+    "UPDATE visitors SET scan_count = (SELECT COUNT(*) FROM visits WHERE visits.visitor_id = visitors.id) "
+    "WHERE qr_data IN (SELECT qr_data FROM src.visitors)"
+)
+# Колонки, по которым разрешена сортировка журнала
+SORT_COLUMNS = ("full_name", "organization", "visit_time", "event")
+
+
+def connect(db_name):
+    """Подключение к базе посетителей в режиме WAL"""
+    conn = sqlite3.connect(db_name, cached_statements=256)
+    # WAL: запись не блокирует чтение, а synchronous=NORMAL
+    # синхронизирует диск только при контрольных точках
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    # Встроенные LOWER и LIKE не учитывают регистр только для латиницы
+    conn.create_function("lower_u", 1, lower_u, deterministic=True)
+    return conn
+
+
+def lower_u(value):
+    """Нижний регистр для любых букв (для поиска без учета регистра в SQL)"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def checkpoint(conn):
+    """Перенос журнала WAL в основной файл базы с синхронизацией на диск.
+
+    PRAGMA optimize перед закрытием обновляет статистику планировщика
+    (ANALYZE) для таблиц, которые заметно изменились.
+    """
+    try:
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.Error:
+        # База занята читателем - журнал будет перенесен при следующем запуске
+        pass
+
+
+def init_schema(conn):
+    """Создание и обновление схемы.
+
+    visitors - одна строка на посетителя с последним посещением (для журнала
+    в окне), visits - полная история сканирований. Время хранится целым
+    числом секунд Unix, старые базы со строками времени переводятся один раз.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS visitors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT,
+            organization TEXT,
+            qr_data TEXT UNIQUE,
+            visit_time DATETIME,
+            event TEXT,
+            scan_count INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(visitors)")]
+    if "scan_count" not in columns:
+        conn.execute("ALTER TABLE visitors ADD COLUMN scan_count INTEGER NOT NULL DEFAULT 1")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitors_visit_time ON visitors(visit_time, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitors_event ON visitors(event, visit_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visitors_organization ON visitors(organization)")
+
+    has_visits = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='visits'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS visits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            visitor_id INTEGER NOT NULL REFERENCES visitors(id),
+            ts DATETIME NOT NULL,
+            event TEXT,
+            station TEXT
+        )
+    ''')
+    if not has_visits:
+        # В старых базах известно только последнее посещение каждого гостя
+        conn.execute(
+            "INSERT INTO visits (visitor_id, ts, event) "
+            "SELECT id, visit_time, event FROM visitors WHERE visit_time IS NOT NULL"
+        )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visits_visitor ON visits(visitor_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visits_event ON visits(event, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_visits_ts ON visits(ts)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS export_watermarks (
+            name TEXT PRIMARY KEY,
+            last_visit_id INTEGER NOT NULL,
+            exported_at DATETIME
+        )
+    ''')
+
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        # Строки, которые не удается разобрать как время, остаются как есть
+        for table, column in (("visitors", "visit_time"), ("visits", "ts"), ("export_watermarks", "exported_at")):
+            conn.execute(
+                f"UPDATE {table} SET {column} = {epoch_sql(column)} "
+                f"WHERE typeof({column}) = 'text' AND strftime('%s', {column}) IS NOT NULL"
+            )
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+        # Статистика для выбора индексов планировщиком
+        conn.execute("ANALYZE")
+    conn.commit()
+
+
+def format_time(value):
+    """Время в секундах Unix как строка местного времени"""
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value).strftime(TIME_FORMAT)
+    return "" if value is None else str(value)
+
+
+def parse_qr_data(qr_data):
+    """Разбор данных QR-кода (ожидаем формат "ФИО;Организация")"""
+    parts = qr_data.split(';')
+    full_name = parts[0] if len(parts) > 0 else "Неизвестный"
+    organization = parts[1] if len(parts) > 1 else "Не указана"
+    return full_name, organization
+
+
+def check_in_many(conn, check_ins):
+    """Регистрация пачки посещений в одной транзакции.
+
+    check_ins - кортежи (qr_data, время в секундах Unix, мероприятие, станция). Посетитель
+    добавляется или обновляется запросом INSERT ... ON CONFLICT DO UPDATE,
+    посещение дописывается в visits. Возвращает для каждого посещения
+    (id, ФИО, организация, признак нового посетителя).
+    """
+    results = []
+    with conn:
+        for qr_data, visit_time, event, station in check_ins:
+            full_name, organization = parse_qr_data(qr_data)
+            visitor_id, full_name, organization, scan_count = conn.execute(
+                CHECK_IN_SQL, (full_name, organization, qr_data, visit_time, event)
+            ).fetchone()
+            conn.execute(VISIT_SQL, (visitor_id, visit_time, event, station))
+            results.append((visitor_id, full_name, organization, scan_count == 1))
+    return results
+
+
+def check_in(conn, qr_data, visit_time, event, station=None):
+    """Регистрация одного посещения"""
+    return check_in_many(conn, [(qr_data, visit_time, event, station)])[0]
+
+
+def clear(conn):
+    """Удаление всех посетителей и истории посещений"""
+    with conn:
+        conn.execute("DELETE FROM visits")
+        conn.execute("DELETE FROM visitors")
+
+
+def merge_database(conn, path):
+    """Перенос посетителей и посещений из другой базы.
+
+    База подключается через ATTACH и переносится запросами INSERT ... SELECT
+    в одной транзакции. Возвращает (новых посетителей, новых посещений).
+    """
+    conn.execute("ATTACH DATABASE ? AS src", (path,))
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM src.sqlite_master WHERE type='table'")}
+        if "visitors" not in tables:
+            raise ValueError(f"В базе {path} нет таблицы посетителей")
+        with conn:
+            visitors_before = conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
+            conn.execute(MERGE_VISITORS_SQL)
+            added_visitors = conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0] - visitors_before
+            added_visits = conn.execute(
+                MERGE_VISITS_SQL if "visits" in tables else MERGE_LAST_VISITS_SQL
+            ).rowcount
+            conn.execute(MERGE_SCAN_COUNT_SQL)
+    finally:
+        conn.execute("DETACH DATABASE src")
+    return added_visitors, added_visits
+
+
+def last_visit_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM visits").fetchone()[0]
+
+
+def get_watermark(conn, name):
+    """id последнего посещения, выгруженного под именем name (0 - выгрузок не было)"""
+    row = conn.execute("SELECT last_visit_id FROM export_watermarks WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_watermark(conn, name, last_visit_id, exported_at):
+    with conn:
+        conn.execute(
+            "INSERT INTO export_watermarks (name, last_visit_id, exported_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET last_visit_id=excluded.last_visit_id, exported_at=excluded.exported_at",
+            (name, last_visit_id, exported_at)
+        )
+
+
+def count_new_visits(conn, name):
+    """Количество посещений после отметки прошлой выгрузки"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM visits WHERE id > ?", (get_watermark(conn, name),)
+    ).fetchone()[0]
+
+
+def fetch_attendance(conn, event=None, since=None, until=None):
+    """Посещаемость по мероприятиям за период.
+
+    since и until - время в секундах Unix. Возвращает строки (мероприятие,
+    уникальных посетителей, сканирований, первое и последнее посещение).
+    Фильтр по мероприятию и времени выполняется по индексу idx_visits_event
+    или idx_visits_ts.
+    """
+    conditions = []
+    params = []
+    if event is not None:
+        conditions.append("event = ?")
+        params.append(event)
+    if since is not None:
+        conditions.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("ts < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    sql = (
+        "SELECT event, COUNT(DISTINCT visitor_id), COUNT(*), "
+        f"{local_time_sql('MIN(ts)')}, {local_time_sql('MAX(ts)')} FROM visits "
+        f"{where}GROUP BY event ORDER BY event"
+    )
+    return conn.execute(sql, params).fetchall()
+
+
+def matches_search(values, search):
+    """Проверка значений тем же правилом, что и фильтр fetch_visitors_page"""
+    if not search:
+        return True
+    search = search.lower()
+    return any(value is not None and search in str(value).lower() for value in values)
+
+
+def fetch_visitors_page(conn, order_by="visit_time", descending=True, search=None,
+                        after=None, limit=200):
+    """Одна страница журнала посетителей.
+
+    Используется постраничная выборка по ключу: after - пара (значение
+    колонки сортировки, id) последней загруженной строки, поэтому страница
+    читается по индексу без OFFSET. Возвращает строки
+    (id, qr_data, full_name, organization, visit_time, event).
+    """
+    if order_by not in SORT_COLUMNS:
+        raise ValueError(f"Недопустимая колонка сортировки: {order_by}")
+    direction = "DESC" if descending else "ASC"
+    conditions = []
+    params = []
+
+    if search:
+        # Поиск без учета регистра, в том числе для кириллицы
+        search = search.lower()
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conditions.append(
+            "(lower_u(full_name) LIKE ? ESCAPE '\\' OR lower_u(organization) LIKE ? ESCAPE '\\' "
+            "OR lower_u(event) LIKE ? ESCAPE '\\')"
+        )
+        params += [pattern, pattern, pattern]
+
+    if after is not None:
+        # NULL в SQLite меньше любого значения: при сравнении кортежей он дает
+        # NULL вместо истины, поэтому такие строки обрабатываются отдельно
+        value, last_id = after
+        if value is None:
+            if descending:
+                conditions.append(f"({order_by} IS NULL AND id < ?)")
+            else:
+                conditions.append(f"(({order_by} IS NULL AND id > ?) OR {order_by} IS NOT NULL)")
+            params.append(last_id)
+        else:
+            if descending:
+                conditions.append(f"(({order_by}, id) < (?, ?) OR {order_by} IS NULL)")
+            else:
+                conditions.append(f"({order_by}, id) > (?, ?)")
+            params += [value, last_id]
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    sql = (
+        "SELECT id, qr_data, full_name, organization, visit_time, event FROM visitors "
+        f"{where}ORDER BY {order_by} {direction}, id {direction} LIMIT ?"
+    )
+    return conn.execute(sql, params + [limit]).fetchall()
@@ -0,0 +1,180 @@
+import csv
+import io
+import os
+from itertools import islice
+
+import openpyxl
+
+try:
+    # Необязательный быстрый читатель Excel (python-calamine)
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+# Фильтр для диалога выбора файла с данными
+FILE_FILTER = "Таблицы (*.xlsx *.xlsm *.xls *.csv *.tsv *.txt);;Excel Files (*.xlsx *.xlsm *.xls);;CSV (*.csv *.tsv *.txt)"
+# Кодировки текстовых файлов: выгрузки из Excel в России часто идут в cp1251
+TEXT_ENCODINGS = ("utf-8-sig", "cp1251")
+# Объем начала файла для определения кодировки и разделителя
+SNIFF_SIZE = 64 * 1024
+
+
+def clean_values(values):
+    """Непустые значения колонки в виде строк без пробелов по краям"""
+    for value in values:
+        if value is not None:
+            value = str(value).strip()
+            if value:
+                yield value
+
+
+class OpenpyxlReader:
+    """Чтение .xlsx через openpyxl в режиме read_only"""
+
+    def __init__(self, path, data=None):
+        self.wb = openpyxl.load_workbook(path if data is None else io.BytesIO(data), read_only=True)
+        self.sheetnames = list(self.wb.sheetnames)
+
+    def headers(self, sheet_name):
+        rows = self.wb[sheet_name].iter_rows(min_row=1, max_row=1, values_only=True)
+        return tuple(next(rows, ()))
+
+    def iter_column(self, sheet_name, col_idx):
+        # В результат попадает одна колонка, но XML строки разбирается целиком
+        rows = self.wb[sheet_name].iter_rows(min_row=2, min_col=col_idx, max_col=col_idx, values_only=True)
+        for row in rows:
+            if row:
+                yield row[0]
+
+    def close(self):
+        self.wb.close()
+
+
+class CalamineReader:
+    """Чтение Excel (.xlsx, .xls) через python-calamine - в разы быстрее openpyxl"""
+
+    def __init__(self, path, data=None):
+        if data is None:
+            self.wb = CalamineWorkbook.from_path(path)
+        else:
+            self.wb = CalamineWorkbook.from_filelike(io.BytesIO(data))
+        self.sheetnames = list(self.wb.sheet_names)
+
+    def sheet(self, sheet_name):
+        sheet = self.wb.get_sheet_by_name(sheet_name)
+        # Диапазон данных может начинаться не с ячейки A1
+        first_row, first_col = sheet.start or (0, 0)
+        return sheet, first_row, first_col
+
+    @staticmethod
+    def value(value):
+        # Числа calamine возвращает как float, целые приводим к int, как openpyxl
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    def headers(self, sheet_name):
+        sheet, first_row, first_col = self.sheet(sheet_name)
+        if first_row > 0:
+            return ()
+        row = next(sheet.iter_rows(), [])
+        return tuple([None] * first_col + [self.value(value) for value in row])
+
+    def iter_column(self, sheet_name, col_idx):
+        sheet, first_row, first_col = self.sheet(sheet_name)
+        index = col_idx - 1 - first_col
+        if index < 0:
+            return
+        for row in islice(sheet.iter_rows(), max(0, 1 - first_row), None):
+            if len(row) > index:
+                yield self.value(row[index])
+
+    def close(self):
+        self.wb.close()
+
+
+class CsvReader:
+    """Чтение CSV/TSV: файл считается одним листом с именем файла"""
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data
+        if data is None:
+            with open(path, "rb") as f:
+                sample = f.read(SNIFF_SIZE)
+        else:
+            sample = data[:SNIFF_SIZE]
+        self.encoding = TEXT_ENCODINGS[-1]
+        for encoding in TEXT_ENCODINGS:
+            try:
+                text = sample.decode(encoding)
+            except UnicodeDecodeError as e:
+                # Образец мог оборваться посреди многобайтового символа
+                if e.start < len(sample) - 4:
+                    continue
+                text = sample[:e.start].decode(encoding)
+            self.encoding = encoding
+            break
+        else:
+            text = sample.decode(self.encoding, errors="replace")
+
+        if path.lower().endswith(".tsv"):
+            self.delimiter = "\t"
+        else:
+            try:
+                self.delimiter = csv.Sniffer().sniff(text, delimiters=",;\t").delimiter
+            except csv.Error:
+                self.delimiter = ","
+        self.sheetnames = [os.path.splitext(os.path.basename(path))[0]]
+
+    def rows(self):
+        if self.data is None:
+            f = open(self.path, encoding=self.encoding, newline="")
+        else:
+            f = io.TextIOWrapper(io.BytesIO(self.data), encoding=self.encoding, newline="")
+        with f:
+            yield from csv.reader(f, delimiter=self.delimiter)
+
+    def headers(self, sheet_name):
+        return tuple(next(self.rows(), ()))
+
+    def iter_column(self, sheet_name, col_idx):
+        for row in islice(self.rows(), 1, None):
+            if len(row) >= col_idx:
+                yield row[col_idx - 1]
+
+    def close(self):
+        pass
+
+
+def excel_reader(path, data=None):
+    if CalamineWorkbook is not None:
+        return CalamineReader(path, data)
+    if path.lower().endswith(".xls"):
+        raise ValueError("Для чтения файлов .xls нужен пакет python-calamine")
+    return OpenpyxlReader(path, data)
+
+
+# Читатели по расширению файла; новые форматы добавляются сюда
+READERS = {
+    ".xlsx": excel_reader,
+    ".xlsm": excel_reader,
+    ".xls": excel_reader,
+    ".csv": CsvReader,
+    ".tsv": CsvReader,
+    ".txt": CsvReader,
+}
+
+
+def open_table(path, data=None):
+    """Открытие таблицы подходящим читателем.
+
+    data - уже прочитанное содержимое файла: тогда файл на диске не
+    открывается. У читателя есть список листов sheetnames и методы
+    headers(лист), iter_column(лист, номер колонки с 1) и close().
+    """
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Неподдерживаемый формат файла: {extension or path}")
+    return reader(path, data)
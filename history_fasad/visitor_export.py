@@ -0,0 +1,206 @@
+import csv
+import os
+import sqlite3
+import time
+
+import openpyxl
+
+import storage
+
+try:
+    # Parquet доступен, только если установлен pyarrow
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Фильтр для диалога сохранения журнала
+FILE_FILTER = "Excel Files (*.xlsx);;CSV (*.csv);;Parquet (*.parquet)"
+# Количество строк, читаемых из базы за один раз
+CHUNK_SIZE = 1000
+# Размер буфера записи CSV
+WRITE_BUFFER = 1024 * 1024
+# Колонки выгрузки журнала посещений
+VISIT_HEADERS = ["ФИО", "Организация", "Время посещения", "Мероприятие", "Станция"]
+
+
+class XlsxRowWriter:
+    """Запись в .xlsx в режиме write_only: строки сразу уходят во временный файл.
+
+    При дополнении существующей книги она загружается целиком - openpyxl
+    не умеет дописывать строки в сохраненный файл. Строки дописываются на
+    лист с такими же заголовками; если его нет, создается новый лист.
+    """
+
+    def __init__(self, path, headers, append=False):
+        self.path = path
+        if append and os.path.exists(path):
+            self.wb = openpyxl.load_workbook(path)
+            headers = list(headers)
+            for sheet in self.wb.worksheets:
+                first_row = next(sheet.iter_rows(max_row=1, values_only=True), ())
+                if list(first_row[:len(headers)]) == headers:
+                    self.sheet = sheet
+                    break
+            else:
+                self.sheet = self.wb.create_sheet("Посещения")
+                self.sheet.append(headers)
+        else:
+            self.wb = openpyxl.Workbook(write_only=True)
+            self.sheet = self.wb.create_sheet("Посетители")
+            self.sheet.append(headers)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.wb.save(self.path)
+
+    def abort(self):
+        # Книга не сохраняется, файл на диске остается прежним
+        self.wb.close()
+
+
+class CsvRowWriter:
+    """Запись в CSV с разделителем ";" и BOM - файл сразу открывается в Excel.
+
+    Дописывать можно только в файл с такими же заголовками.
+    """
+
+    def __init__(self, path, headers, append=False):
+        self.path = path
+        self.start = os.path.getsize(path) if append and os.path.exists(path) else 0
+        if self.start:
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                first_row = next(csv.reader(f, delimiter=";"), [])
+            if first_row != list(headers):
+                raise ValueError("В файле другие колонки, выберите для дополнения другой файл")
+            # Дописываем в конец без заголовка и повторного BOM
+            self.f = open(path, "a", encoding="utf-8", newline="", buffering=WRITE_BUFFER)
+        else:
+            self.f = open(path, "w", encoding="utf-8-sig", newline="", buffering=WRITE_BUFFER)
+        self.writer = csv.writer(self.f, delimiter=";")
+        if not self.start:
+            self.writer.writerow(headers)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+        if self.start:
+            # Отрезаем дописанную часть
+            os.truncate(self.path, self.start)
+        else:
+            os.remove(self.path)
+
+
+class ParquetRowWriter:
+    """Запись в Parquet: каждая пачка строк - отдельная группа строк файла"""
+
+    def __init__(self, path, headers, append=False):
+        if pyarrow is None:
+            raise ValueError("Для сохранения в Parquet нужен пакет pyarrow")
+        if append and os.path.exists(path):
+            raise ValueError("Дополнение файлов Parquet не поддерживается, выберите новый файл")
+        self.path = path
+        self.headers = list(headers)
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in self.headers])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = [[None if value is None else str(value) for value in column] for column in zip(*rows)]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.path)
+
+
+ROW_WRITERS = {
+    ".xlsx": XlsxRowWriter,
+    ".csv": CsvRowWriter,
+    ".parquet": ParquetRowWriter,
+}
+
+
+def open_row_writer(path, headers, append=False):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ROW_WRITERS:
+        raise ValueError(f"Неподдерживаемый формат файла: {extension or path}")
+    return ROW_WRITERS[extension](path, headers, append)
+
+
+def write_query(conn, sql, params, headers, file_path, append=False, cancel_event=None, progress=None):
+    """Запись результата запроса пачками по CHUNK_SIZE строк.
+
+    При отмене или ошибке файл остается в прежнем состоянии.
+    Возвращает количество записанных строк.
+    """
+    total = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+    cursor = conn.execute(sql, params)
+    writer = open_row_writer(file_path, headers, append)
+    exported_count = 0
+    try:
+        while not (cancel_event is not None and cancel_event.is_set()):
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            writer.write(rows)
+            exported_count += len(rows)
+            if progress is not None:
+                progress(exported_count, total)
+    except BaseException:
+        writer.abort()
+        raise
+    if cancel_event is not None and cancel_event.is_set():
+        writer.abort()
+    else:
+        writer.close()
+    return exported_count
+
+
+def export_rows(db_name, sql, headers, file_path, params=(), cancel_event=None, progress=None):
+    """Потоковая выгрузка результата запроса в файл.
+
+    Запрос выполняется через отдельное соединение (экспорт идет в фоновом
+    потоке), строки читаются пачками по CHUNK_SIZE и сразу записываются,
+    поэтому расход памяти не зависит от размера журнала.
+    Возвращает количество выгруженных строк.
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        return write_query(conn, sql, params, headers, file_path, False, cancel_event, progress)
+    finally:
+        conn.close()
+
+
+def export_new_visits(db_name, file_path, name="excel", cancel_event=None, progress=None):
+    """Выгрузка только посещений, добавленных после прошлой выгрузки.
+
+    Отметка (id последнего выгруженного посещения) хранится в базе под
+    именем name и сдвигается только после успешной записи файла.
+    Существующий файл дополняется.
+    """
+    conn = storage.connect(db_name)
+    try:
+        after = storage.get_watermark(conn, name)
+        # Верхняя граница фиксируется заранее: посещения, записанные во время
+        # выгрузки, попадут в следующую
+        upto = storage.last_visit_id(conn)
+        exported_count = write_query(
+            conn, storage.NEW_VISITS_SQL, (after, upto), VISIT_HEADERS, file_path,
+            True, cancel_event, progress
+        )
+        if not (cancel_event is not None and cancel_event.is_set()):
+            storage.set_watermark(conn, name, upto, int(time.time()))
+        return exported_count
+    finally:
+        conn.close()
@@ -0,0 +1,172 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+import storage
+
+# Количество строк, подгружаемых из базы за один раз
+PAGE_SIZE = 200
+
+
+class VisitorTableModel(QAbstractTableModel):
+    """Модель журнала посетителей поверх SQLite.
+
+    Строки подгружаются страницами по мере прокрутки (canFetchMore/fetchMore),
+    сортировка и фильтрация выполняются запросом к базе. После скана модель
+    не перечитывает таблицу, а вставляет, перемещает или убирает одну строку
+    с учетом текущей сортировки и фильтра.
+    """
+    HEADERS = ["ФИО", "Организация", "Время посещения", "Мероприятие"]
+    TIME_COLUMN = storage.SORT_COLUMNS.index("visit_time")
+
+    def __init__(self, conn, parent=None):
+        super().__init__(parent)
+        self.conn = conn
+        self.sort_column = storage.SORT_COLUMNS.index("visit_time")
+        self.descending = True
+        self.search = ""
+        self.rows = []
+        self.keys = []
+        self.ids = []
+        self.has_more = False
+
+    def reload(self):
+        """Перезагрузка с первой страницы"""
+        self.beginResetModel()
+        self.rows = []
+        self.keys = []
+        self.ids = []
+        self.has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def set_filter(self, text):
+        self.search = text.strip()
+        self.reload()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.has_more:
+            return
+
+        after = None
+        if self.rows:
+            after = (self.rows[-1][self.sort_column], self.ids[-1])
+        page = storage.fetch_visitors_page(
+            self.conn, storage.SORT_COLUMNS[self.sort_column], self.descending,
+            self.search, after, PAGE_SIZE
+        )
+        self.has_more = len(page) == PAGE_SIZE
+        if not page:
+            return
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+        for visitor_id, qr_data, *row in page:
+            self.ids.append(visitor_id)
+            self.keys.append(qr_data)
+            self.rows.append(row)
+        self.endInsertRows()
+
+    def sort_key(self, row, visitor_id):
+        """Ключ сортировки в порядке SQLite: NULL, затем числа, затем строки"""
+        value = row[self.sort_column]
+        if value is None:
+            return (0, 0, visitor_id)
+        if isinstance(value, str):
+            return (2, value, visitor_id)
+        return (1, value, visitor_id)
+
+    def insert_position(self, key, skip=None):
+        """Позиция строки с ключом key среди загруженных строк (без строки skip)"""
+        position = 0
+        for index, (row, visitor_id) in enumerate(zip(self.rows, self.ids)):
+            if index == skip:
+                continue
+            row_key = self.sort_key(row, visitor_id)
+            if (row_key < key) if self.descending else (row_key > key):
+                return position
+            position += 1
+        return position
+
+    def record_check_in(self, visitor_id, qr_data, full_name, organization, visit_time, event):
+        """Отображение нового посещения без перезагрузки модели.
+
+        Строка, не подходящая под фильтр или попавшая за пределы загруженной
+        части, не показывается - она появится при подгрузке страниц.
+        """
+        row = [full_name, organization, visit_time, event]
+        try:
+            position = self.keys.index(qr_data)
+        except ValueError:
+            position = None
+
+        target = None
+        if storage.matches_search((full_name, organization, event), self.search):
+            target = self.insert_position(self.sort_key(row, visitor_id), position)
+            loaded = len(self.rows) - (position is not None)
+            if target == loaded and self.has_more:
+                target = None
+
+        if position is None:
+            if target is None:
+                return
+            self.beginInsertRows(QModelIndex(), target, target)
+            self.ids.insert(target, visitor_id)
+            self.keys.insert(target, qr_data)
+            self.rows.insert(target, row)
+            self.endInsertRows()
+            return
+
+        if target is None:
+            self.beginRemoveRows(QModelIndex(), position, position)
+            del self.ids[position]
+            del self.keys[position]
+            del self.rows[position]
+            self.endRemoveRows()
+            return
+
+        if target != position:
+            # Для Qt позиция назначения считается до удаления строки
+            self.beginMoveRows(
+                QModelIndex(), position, position, QModelIndex(), target + 1 if target > position else target
+            )
+            self.ids.insert(target, self.ids.pop(position))
+            self.keys.insert(target, self.keys.pop(position))
+            self.rows.insert(target, self.rows.pop(position))
+            self.endMoveRows()
+        self.rows[target] = row
+        self.dataChanged.emit(self.index(target, 0), self.index(target, len(self.HEADERS) - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            value = self.rows[index.row()][index.column()]
+            # Время хранится в секундах Unix, на экран выводится строкой
+            if index.column() == self.TIME_COLUMN:
+                return storage.format_time(value)
+            return str(value)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
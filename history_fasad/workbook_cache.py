@@ -0,0 +1,89 @@
+import os
+import threading
+
+from qr_engine import LRUCache
+from table_readers import clean_values, open_table
+
+
+def file_stamp(path):
+    """Отпечаток файла: при изменении времени модификации или размера кэш сбрасывается"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CachedWorkbook:
+    """Таблица (Excel или CSV), разобранная один раз для одного отпечатка файла.
+
+    Файл читается в память целиком и сразу закрывается, чтобы Excel мог
+    сохранять исходную книгу, пока открыт генератор. Читатель работает с
+    копией в памяти и остается открытым, поэтому общие строки и структура
+    листов разбираются только при загрузке. Заголовки листов и выбранные
+    колонки запоминаются после первого чтения.
+    """
+
+    def __init__(self, path, stamp, max_columns=8):
+        self.path = path
+        self.stamp = stamp
+        with open(path, "rb") as f:
+            data = f.read()
+        self.reader = open_table(path, data)
+        self.sheetnames = list(self.reader.sheetnames)
+        self.headers = {}
+        self.columns = LRUCache(max_columns)
+        self.lock = threading.Lock()
+
+    def sheet_headers(self, sheet_name):
+        """Значения первой строки листа"""
+        with self.lock:
+            headers = self.headers.get(sheet_name)
+            if headers is None:
+                headers = self.headers[sheet_name] = self.reader.headers(sheet_name)
+            return headers
+
+    def column(self, sheet_name, col_idx):
+        """Непустые значения колонки без заголовка (col_idx начинается с 1)"""
+        key = (sheet_name, col_idx)
+        with self.lock:
+            values = self.columns.get(key)
+            if values is None:
+                values = tuple(clean_values(self.reader.iter_column(sheet_name, col_idx)))
+                self.columns.put(key, values)
+            return values
+
+    def close(self):
+        with self.lock:
+            self.reader.close()
+            self.headers.clear()
+            self.columns.clear()
+
+
+class WorkbookCache:
+    """Кэш разобранных книг по пути и отпечатку файла (время изменения, размер)"""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.books = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        stamp = file_stamp(path)
+        with self.lock:
+            book = self.books.pop(path, None)
+            if book is not None and book.stamp != stamp:
+                # Файл изменился на диске - разбираем заново
+                book.close()
+                book = None
+            if book is None:
+                book = CachedWorkbook(path, stamp)
+            self.books[path] = book
+            while len(self.books) > self.maxsize:
+                oldest = next(iter(self.books))
+                self.books.pop(oldest).close()
+            return book
+
+    def clear(self):
+        with self.lock:
+            for book in self.books.values():
+                book.close()
+            self.books.clear()
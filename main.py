@@ -3,11 +3,19 @@ import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                              QWidget, QLabel, QPushButton, QFileDialog, QListWidget,
                              QMessageBox, QComboBox, QSpinBox)
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import Qt, QByteArray, QBuffer
-import openpyxl
 import qrcode
-from PIL import Image
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+from qr_tasks import start_generation, start_export
+import qr_engine
+import qr_export
+from functools import partial
+from qt_image import pil_to_qimage
+from workbook_cache import WorkbookCache
+from table_readers import FILE_FILTER
 
 
 class QRGeneratorApp(QMainWindow):
@@ -21,6 +29,13 @@ class QRGeneratorApp(QMainWindow):
         self.sheet_name = None
         self.column_name = None
         self.qr_codes = {}
+        self.qr_size = None
+        # Отрисованные коды хранятся только для недавно просмотренных записей
+        self.qr_pixmaps = qr_engine.LRUCache(32)
+        # Разобранные книги Excel: листы, заголовки и колонки читаются один раз
+        self.workbooks = WorkbookCache()
+        self.generation_thread = None
+        self.export_thread = None
         
         # Создаем основной виджет и layout
         central_widget = QWidget()
@@ -94,14 +109,17 @@ class QRGeneratorApp(QMainWindow):
         save_current_btn.clicked.connect(self.save_current_qr)
         save_all_btn = QPushButton("Сохранить все QR-коды")
         save_all_btn.clicked.connect(self.save_all_qr)
+        save_archive_btn = QPushButton("Сохранить в один файл (ZIP/PDF)")
+        save_archive_btn.clicked.connect(self.save_qr_archive)
         save_layout.addWidget(save_current_btn)
         save_layout.addWidget(save_all_btn)
+        save_layout.addWidget(save_archive_btn)
         main_layout.addLayout(save_layout)
     
     def load_excel_file(self):
         """Загрузка Excel файла"""
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Выберите файл Excel", "", "Excel Files (*.xlsx *.xls)"
+            self, "Выберите файл Excel или CSV", "", FILE_FILTER
         )
         
         if file_path:
@@ -110,10 +128,9 @@ class QRGeneratorApp(QMainWindow):
             
             # Загружаем доступные листы
             try:
-                wb = openpyxl.load_workbook(file_path, read_only=True)
+                book = self.workbooks.get(file_path)
                 self.sheet_combo.clear()
-                self.sheet_combo.addItems(wb.sheetnames)
-                wb.close()
+                self.sheet_combo.addItems(book.sheetnames)
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {str(e)}")
     
@@ -127,17 +144,14 @@ class QRGeneratorApp(QMainWindow):
         sheet_name = self.sheet_combo.currentText()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
+            headers = self.workbooks.get(self.excel_file).sheet_headers(sheet_name)
             
             # Получаем заголовки колонок из первой строки
-            for col_idx, cell in enumerate(sheet[1], 1):
-                if cell.value:  # Если ячейка не пустая
-                    self.column_combo.addItem(str(cell.value), col_idx)
+            for col_idx, value in enumerate(headers, 1):
+                if value:  # Если ячейка не пустая
+                    self.column_combo.addItem(str(value), col_idx)
                 else:
                     self.column_combo.addItem(f"Колонка {col_idx}", col_idx)
-            
-            wb.close()
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать колонки: {str(e)}")
     
@@ -146,67 +160,59 @@ class QRGeneratorApp(QMainWindow):
         if not all([self.excel_file, self.sheet_combo.currentText(), self.column_combo.currentText()]):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите файл, лист и колонку")
             return
+        if self.generation_thread and self.generation_thread.isRunning():
+            return
             
         self.data_list.clear()
         self.qr_codes = {}
+        self.qr_pixmaps.clear()
         sheet_name = self.sheet_combo.currentText()
-        column = self.column_combo.currentText()
-        col_idx = self.column_combo.currentData()  # Получаем индекс колонки
-        qr_size = self.size_spin.value()
+        col_idx = self.column_combo.currentData()
+        self.qr_size = self.size_spin.value()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
-            
-            # Читаем данные из колонки (пропускаем заголовок)
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if len(row) >= col_idx:  # Проверяем, что строка имеет достаточно колонок
-                    value = row[col_idx-1]
-                    if value is not None:
-                        value = str(value).strip()
-                        if value:  # Если значение не пустое
-                            # Генерируем QR-код
-                            qr = qrcode.QRCode(
-                                version=1,
-                                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                                box_size=10,
-                                border=4,
-                            )
-                            qr.add_data(value)
-                            qr.make(fit=True)
-                            
-                            img = qr.make_image(fill_color="black", back_color="white")
-                            img = img.resize((qr_size, qr_size))
-                            
-                            # Сохраняем в словарь
-                            self.qr_codes[value] = img
-                            self.data_list.addItem(value)
-            
-            wb.close()
-            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+            # Колонка берется из кэша книги, файл повторно не разбирается
+            values = self.workbooks.get(self.excel_file).column(sheet_name, col_idx)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {str(e)}")
+            return
+        
+        # Генерация выполняется пулом процессов, интерфейс остается отзывчивым
+        self.generation_thread = start_generation(
+            self, values, self.add_generated_qr_codes, self.on_generation_finished,
+            error_correction=qrcode.constants.ERROR_CORRECT_L
+        )
+    
+    def add_generated_qr_codes(self, batch):
+        for value, code in batch:
+            # Хранится только компактная матрица, изображение строится по запросу
+            self.qr_codes[value] = code
+            self.data_list.addItem(value)
+    
+    def on_generation_finished(self, cancelled, error):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Генерация прервана, готово {len(self.qr_codes)} QR-кодов")
+        else:
+            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+    
+    def render_qr(self, text):
+        return self.qr_codes[text].render(self.qr_size)
     
     def show_qr_code(self, item):
         """Отображение выбранного QR-кода"""
         text = item.text()
         if text in self.qr_codes:
-            img = self.qr_codes[text]
-            
-            # Конвертируем PIL.Image в QPixmap
-            qimage = QImage(img.tobytes(), img.size[0], img.size[1], QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimage)
+            display_size = min(self.qr_display.width(), self.qr_display.height())
+            pixmap = self.qr_pixmaps.get((text, display_size))
+            if pixmap is None:
+                # Код рисуется сразу в размере области просмотра, без масштабирования
+                img = self.qr_codes[text].render(display_size)
+                pixmap = QPixmap.fromImage(pil_to_qimage(img))
+                self.qr_pixmaps.put((text, display_size), pixmap)
             
-            # Масштабируем изображение для отображения
-            if not pixmap.isNull():
-                pixmap = pixmap.scaled(
-                    self.qr_display.width(), 
-                    self.qr_display.height(),
-                    Qt.KeepAspectRatio
-                )
-                self.qr_display.setPixmap(pixmap)
-            else:
-                self.qr_display.clear()
+            self.qr_display.setPixmap(pixmap)
     
     def save_current_qr(self):
         """Сохранение текущего QR-кода"""
@@ -225,7 +231,7 @@ class QRGeneratorApp(QMainWindow):
         
         if file_path:
             try:
-                self.qr_codes[text].save(file_path)
+                self.render_qr(text).save(file_path)
                 QMessageBox.information(self, "Успешно", "QR-код сохранен")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
@@ -235,25 +241,64 @@ class QRGeneratorApp(QMainWindow):
         if not self.qr_codes:
             QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
             return
+        if self.export_thread and self.export_thread.isRunning():
+            return
             
         dir_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
         
         if dir_path:
-            try:
-                saved_count = 0
-                for text, img in self.qr_codes.items():
-                    # Очищаем имя файла от недопустимых символов
-                    safe_text = "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip()
-                    file_path = os.path.join(dir_path, f"{safe_text}.png")
-                    img.save(file_path)
-                    saved_count += 1
-                
-                QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {str(e)}")
+            # PNG кодируются пулом процессов в фоновом потоке
+            items = list(self.qr_codes.items())
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items),
+                partial(qr_export.export_png_files, items, dir_path, self.qr_size),
+                self.on_export_finished
+            )
+    
+    def save_qr_archive(self):
+        """Сохранение всех QR-кодов в один ZIP-архив или PDF для печати"""
+        if not self.qr_codes:
+            QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
+            return
+        if self.export_thread and self.export_thread.isRunning():
+            return
+        
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить в один файл", "qr_codes.zip",
+            "ZIP-архив (*.zip);;PDF для печати (*.pdf)"
+        )
+        
+        if file_path:
+            items = list(self.qr_codes.items())
+            if file_path.lower().endswith(".pdf") or (
+                    "pdf" in selected_filter and not file_path.lower().endswith(".zip")):
+                # Листы A4 по 24 кода, запись идет постранично
+                export = partial(qr_export.export_pdf, items, file_path)
+            else:
+                export = partial(qr_export.export_zip, items, file_path, self.qr_size)
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items), export, self.on_export_finished
+            )
+    
+    def on_export_finished(self, cancelled, error, saved_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Сохранение прервано, сохранено {saved_count} QR-кодов")
+        else:
+            QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
+    
+    def closeEvent(self, event):
+        for thread in (self.generation_thread, self.export_thread):
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
+        self.workbooks.clear()
+        event.accept()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = QRGeneratorApp()
     window.show()
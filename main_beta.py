@@ -7,15 +7,21 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout
                             QTableWidgetItem, QMessageBox, QLineEdit, 
                             QStackedWidget, QListWidget, QComboBox, 
                             QSpinBox, QFrame, QFileDialog)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QIcon, QPixmap, QFont, QImage
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QIcon, QPixmap, QFont
 import qrcode
-from pyzbar.pyzbar import decode
-import cv2
-import openpyxl
-from PIL import Image
-import io
-import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+from scanner import CameraScanner
+from qr_tasks import start_generation, start_export
+import qr_engine
+import qr_export
+import visitor_export
+from functools import partial
+from qt_image import pil_to_qimage
+from workbook_cache import WorkbookCache
+from table_readers import FILE_FILTER
+import multiprocessing
 
 class MainApp(QMainWindow):
     def __init__(self):
@@ -214,13 +220,12 @@ class MainApp(QMainWindow):
         self.init_db()
         
         # Настройка камеры
-        self.camera = cv2.VideoCapture(0)
-        self.timer = QTimer()
+        self.scanner = None
         self.scanning = False
+        self.visitors_export_thread = None
         
         # Подключение сигналов
         self.scan_button.clicked.connect(self.toggle_scan)
-        self.timer.timeout.connect(self.update_frame)
         self.export_button.clicked.connect(self.export_to_excel)
         
         # Добавляем виджет в стек
@@ -350,14 +355,32 @@ class MainApp(QMainWindow):
             "}"
         )
         
+        save_archive_btn = QPushButton("Сохранить в один файл (ZIP/PDF)")
+        save_archive_btn.setStyleSheet(
+            "QPushButton {"
+            "background-color: #16a085;"
+            "}"
+            "QPushButton:hover {"
+            "background-color: #138d75;"
+            "}"
+        )
+        
         save_layout.addWidget(save_current_btn)
         save_layout.addWidget(save_all_btn)
+        save_layout.addWidget(save_archive_btn)
         generator_layout.addWidget(save_frame)
         
         # Основные переменные
         self.excel_file = None
         self.current_qr = None
         self.qr_codes = {}
+        self.qr_size = None
+        # Отрисованные коды хранятся только для недавно просмотренных записей
+        self.qr_pixmaps = qr_engine.LRUCache(32)
+        # Разобранные книги Excel: листы, заголовки и колонки читаются один раз
+        self.workbooks = WorkbookCache()
+        self.generation_thread = None
+        self.export_thread = None
         
         # Подключение сигналов
         file_btn.clicked.connect(self.load_excel_file)
@@ -365,6 +388,7 @@ class MainApp(QMainWindow):
         generate_btn.clicked.connect(self.generate_qr_codes)
         save_current_btn.clicked.connect(self.save_current_qr)
         save_all_btn.clicked.connect(self.save_all_qr)
+        save_archive_btn.clicked.connect(self.save_qr_archive)
         
         # Добавляем виджет в стек
         self.stacked_widget.addWidget(self.generator_widget)
@@ -372,6 +396,8 @@ class MainApp(QMainWindow):
     # Методы для режима сканирования
     def init_db(self):
         self.conn = sqlite3.connect('visitors.db')
+        # WAL: фоновый экспорт читает базу, не мешая записи сканов
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self.cursor = self.conn.cursor()
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS visitors (
@@ -383,6 +409,10 @@ class MainApp(QMainWindow):
                 event TEXT
             )
         ''')
+        # Журнал сортируется по времени и фильтруется по мероприятию - по индексам, без полного просмотра
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_visit_time ON visitors(visit_time)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_event ON visitors(event, visit_time)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_organization ON visitors(organization)")
         self.conn.commit()
         self.update_visitors_table()
     
@@ -404,7 +434,11 @@ class MainApp(QMainWindow):
                 "background-color: #d32f2f;"
                 "}"
             )
-            self.timer.start(20)
+            # Захват и распознавание выполняются в отдельных потоках
+            self.scanner = CameraScanner(0)
+            self.scanner.frame_ready.connect(self.update_frame)
+            self.scanner.qr_detected.connect(self.on_qr_detected)
+            self.scanner.start()
         else:
             self.scanning = False
             self.scan_button.setText("Начать сканирование")
@@ -422,45 +456,46 @@ class MainApp(QMainWindow):
                 "background-color: #45a049;"
                 "}"
             )
-            self.timer.stop()
+            self.stop_scanner()
             self.camera_label.clear()
             self.camera_label.setText("Камера отключена")
     
-    def update_frame(self):
-        ret, frame = self.camera.read()
-        if ret:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            decoded_objects = decode(frame)
-            
-            if decoded_objects:
-                qr_data = decoded_objects[0].data.decode('utf-8')
-                self.process_qr_code(qr_data)
-                self.timer.stop()
-                self.scanning = False
-                self.scan_button.setText("Начать сканирование")
-                self.scan_button.setStyleSheet(
-                    "QPushButton {"
-                    "background-color: #4CAF50;"
-                    "border: none;"
-                    "color: white;"
-                    "padding: 10px 24px;"
-                    "text-align: center;"
-                    "font-size: 16px;"
-                    "border-radius: 4px;"
-                    "}"
-                    "QPushButton:hover {"
-                    "background-color: #45a049;"
-                    "}"
-                )
-            
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            self.camera_label.setPixmap(QPixmap.fromImage(q_img).scaled(
-                self.camera_label.width(), 
-                self.camera_label.height(), 
-                Qt.KeepAspectRatio
-            ))
+    def stop_scanner(self):
+        if self.scanner:
+            self.scanner.stop()
+            self.scanner = None
+    
+    def on_qr_detected(self, qr_data):
+        if not self.scanning:
+            return
+        self.stop_scanner()
+        self.scanning = False
+        self.scan_button.setText("Начать сканирование")
+        self.scan_button.setStyleSheet(
+            "QPushButton {"
+            "background-color: #4CAF50;"
+            "border: none;"
+            "color: white;"
+            "padding: 10px 24px;"
+            "text-align: center;"
+            "font-size: 16px;"
+            "border-radius: 4px;"
+            "}"
+            "QPushButton:hover {"
+            "background-color: #45a049;"
+            "}"
+        )
+        self.process_qr_code(qr_data)
+    
+    def update_frame(self, q_img):
+        """Отображение кадра, полученного из потока захвата"""
+        if not self.scanning:
+            return
+        self.camera_label.setPixmap(QPixmap.fromImage(q_img).scaled(
+            self.camera_label.width(), 
+            self.camera_label.height(), 
+            Qt.KeepAspectRatio
+        ))
     
     def process_qr_code(self, qr_data):
         try:
@@ -519,21 +554,36 @@ class MainApp(QMainWindow):
         self.visitor_table.resizeColumnsToContents()
     
     def export_to_excel(self):
+        if self.visitors_export_thread and self.visitors_export_thread.isRunning():
+            return
         try:
-            self.cursor.execute("SELECT full_name, organization, visit_time, event FROM visitors")
-            visitors = self.cursor.fetchall()
-            
-            df = pd.DataFrame(visitors, columns=["ФИО", "Организация", "Время посещения", "Мероприятие"])
-            df.to_excel("visitors.xlsx", index=False)
+            total = self.conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
             
-            QMessageBox.information(self, "Успешно", "Данные экспортированы в visitors.xlsx")
+            # Выгрузка идет пачками в фоновом потоке
+            export = partial(
+                visitor_export.export_rows, 'visitors.db',
+                "SELECT full_name, organization, visit_time, event FROM visitors",
+                ["ФИО", "Организация", "Время посещения", "Мероприятие"], "visitors.xlsx"
+            )
+            self.visitors_export_thread = start_export(
+                self, "Экспорт посетителей...", total, export,
+                partial(self.on_visitors_exported, "visitors.xlsx"), modal=False
+            )
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
     
+    def on_visitors_exported(self, file_path, cancelled, error, exported_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", "Экспорт прерван")
+        else:
+            QMessageBox.information(self, "Успешно", f"Экспортировано {exported_count} записей в {file_path}")
+    
     # Методы для режима генерации
     def load_excel_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Выберите файл Excel", "", "Excel Files (*.xlsx *.xls)"
+            self, "Выберите файл Excel или CSV", "", FILE_FILTER
         )
         
         if file_path:
@@ -541,10 +591,9 @@ class MainApp(QMainWindow):
             self.file_label.setText(os.path.basename(file_path))
             
             try:
-                wb = openpyxl.load_workbook(file_path, read_only=True)
+                book = self.workbooks.get(file_path)
                 self.sheet_combo.clear()
-                self.sheet_combo.addItems(wb.sheetnames)
-                wb.close()
+                self.sheet_combo.addItems(book.sheetnames)
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {str(e)}")
     
@@ -557,16 +606,13 @@ class MainApp(QMainWindow):
         sheet_name = self.sheet_combo.currentText()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
+            headers = self.workbooks.get(self.excel_file).sheet_headers(sheet_name)
             
-            for col_idx, cell in enumerate(sheet[1], 1):
-                if cell.value:
-                    self.column_combo.addItem(str(cell.value), col_idx)
+            for col_idx, value in enumerate(headers, 1):
+                if value:
+                    self.column_combo.addItem(str(value), col_idx)
                 else:
                     self.column_combo.addItem(f"Колонка {col_idx}", col_idx)
-            
-            wb.close()
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать колонки: {str(e)}")
     
@@ -574,61 +620,58 @@ class MainApp(QMainWindow):
         if not all([self.excel_file, self.sheet_combo.currentText(), self.column_combo.currentText()]):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите файл, лист и колонку")
             return
+        if self.generation_thread and self.generation_thread.isRunning():
+            return
             
         self.data_list.clear()
         self.qr_codes = {}
+        self.qr_pixmaps.clear()
         sheet_name = self.sheet_combo.currentText()
-        column = self.column_combo.currentText()
         col_idx = self.column_combo.currentData()
-        qr_size = self.size_spin.value()
+        self.qr_size = self.size_spin.value()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
-            
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if len(row) >= col_idx:
-                    value = row[col_idx-1]
-                    if value is not None:
-                        value = str(value).strip()
-                        if value:
-                            qr = qrcode.QRCode(
-                                version=1,
-                                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                                box_size=12,
-                                border=4,
-                            )
-                            qr.add_data(value)
-                            qr.make(fit=True)
-                            
-                            img = qr.make_image(fill_color="black", back_color="white")
-                            img = img.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-                            
-                            self.qr_codes[value] = img
-                            self.data_list.addItem(value)
-            
-            wb.close()
-            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+            # Колонка берется из кэша книги, файл повторно не разбирается
+            values = self.workbooks.get(self.excel_file).column(sheet_name, col_idx)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {str(e)}")
+            return
+        
+        # Генерация выполняется пулом процессов, интерфейс остается отзывчивым
+        self.generation_thread = start_generation(
+            self, values, self.add_generated_qr_codes, self.on_generation_finished,
+            error_correction=qrcode.constants.ERROR_CORRECT_H
+        )
+    
+    def add_generated_qr_codes(self, batch):
+        for value, code in batch:
+            # Хранится только компактная матрица, изображение строится по запросу
+            self.qr_codes[value] = code
+            self.data_list.addItem(value)
+    
+    def on_generation_finished(self, cancelled, error):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Генерация прервана, готово {len(self.qr_codes)} QR-кодов")
+        else:
+            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+    
+    def render_qr(self, text):
+        return self.qr_codes[text].render(self.qr_size)
     
     def show_qr_code(self, item):
         text = item.text()
         if text in self.qr_codes:
-            self.current_qr = self.qr_codes[text]
-            
-            img_byte_arr = io.BytesIO()
-            self.current_qr.save(img_byte_arr, format='PNG')
-            qimage = QImage.fromData(img_byte_arr.getvalue())
-            pixmap = QPixmap.fromImage(qimage)
+            self.current_qr = text
             
             display_size = min(self.qr_display.width(), self.qr_display.height()) - 20
-            pixmap = pixmap.scaled(
-                display_size, 
-                display_size,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            pixmap = self.qr_pixmaps.get((text, display_size))
+            if pixmap is None:
+                # Код рисуется сразу в размере области просмотра, без масштабирования
+                img = self.qr_codes[text].render(display_size)
+                pixmap = QPixmap.fromImage(pil_to_qimage(img))
+                self.qr_pixmaps.put((text, display_size), pixmap)
             
             self.qr_display.setPixmap(pixmap)
     
@@ -648,7 +691,7 @@ class MainApp(QMainWindow):
         
         if file_path:
             try:
-                self.current_qr.save(file_path)
+                self.render_qr(self.current_qr).save(file_path)
                 QMessageBox.information(self, "Успешно", "QR-код сохранен")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
@@ -657,30 +700,67 @@ class MainApp(QMainWindow):
         if not self.qr_codes:
             QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
             return
+        if self.export_thread and self.export_thread.isRunning():
+            return
             
         dir_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
         
         if dir_path:
-            try:
-                saved_count = 0
-                for text, img in self.qr_codes.items():
-                    safe_text = "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip()
-                    file_path = os.path.join(dir_path, f"{safe_text}.png")
-                    img.save(file_path, "PNG")
-                    saved_count += 1
-                
-                QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {str(e)}")
+            # PNG кодируются пулом процессов в фоновом потоке
+            items = list(self.qr_codes.items())
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items),
+                partial(qr_export.export_png_files, items, dir_path, self.qr_size),
+                self.on_export_finished
+            )
+    
+    def save_qr_archive(self):
+        if not self.qr_codes:
+            QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
+            return
+        if self.export_thread and self.export_thread.isRunning():
+            return
+        
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить в один файл", "qr_codes.zip",
+            "ZIP-архив (*.zip);;PDF для печати (*.pdf)"
+        )
+        
+        if file_path:
+            items = list(self.qr_codes.items())
+            if file_path.lower().endswith(".pdf") or (
+                    "pdf" in selected_filter and not file_path.lower().endswith(".zip")):
+                # Листы A4 по 24 кода, запись идет постранично
+                export = partial(qr_export.export_pdf, items, file_path)
+            else:
+                export = partial(qr_export.export_zip, items, file_path, self.qr_size)
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items), export, self.on_export_finished
+            )
+    
+    def on_export_finished(self, cancelled, error, saved_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Сохранение прервано, сохранено {saved_count} QR-кодов")
+        else:
+            QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
     
     def closeEvent(self, event):
-        if hasattr(self, 'camera') and self.camera.isOpened():
-            self.camera.release()
+        self.stop_scanner()
+        for thread in (self.generation_thread, self.export_thread, self.visitors_export_thread):
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
         if hasattr(self, 'conn'):
+            # Обновление статистики планировщика (ANALYZE) для изменившихся таблиц
+            self.conn.execute("PRAGMA optimize")
             self.conn.close()
+        self.workbooks.clear()
         event.accept()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     window = MainApp()
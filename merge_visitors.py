@@ -0,0 +1,70 @@
+"""Объединение баз посетителей visitors_*.db в одну общую базу.
+
+Пример:
+    python merge_visitors.py -o visitors_all.db
+    python merge_visitors.py -o visitors_all.db day1/visitors_*.db day2/visitors_*.db --report
+
+Каждая база переносится через ATTACH и INSERT ... SELECT одной транзакцией,
+посетители сводятся по qr_data, журнал посещений сохраняется полностью.
+Повторный запуск не дублирует уже перенесенные посещения.
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+import storage
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Объединение баз посетителей в одну")
+    parser.add_argument("inputs", nargs="*",
+                        help="базы для объединения (по умолчанию visitors_*.db в текущей папке)")
+    parser.add_argument("-o", "--output", default="visitors_all.db", help="общая база")
+    parser.add_argument("--report", action="store_true", help="вывести посещаемость по мероприятиям")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    inputs = args.inputs or sorted(glob.glob("visitors_*.db"))
+    inputs = [path for path in inputs if os.path.abspath(path) != output]
+    if not inputs:
+        print("Нет баз для объединения", file=sys.stderr)
+        return 1
+
+    conn = storage.connect(args.output)
+    try:
+        storage.init_schema(conn)
+        started = time.perf_counter()
+        total_visitors = total_visits = 0
+        for path in inputs:
+            try:
+                added_visitors, added_visits = storage.merge_database(conn, path)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"{path}: пропущена - {e}", file=sys.stderr)
+                continue
+            total_visitors += added_visitors
+            total_visits += added_visits
+            print(f"{path}: новых посетителей {added_visitors}, посещений {added_visits}")
+        merge_time = time.perf_counter() - started
+        print(f"Итого в {args.output}: новых посетителей {total_visitors}, "
+              f"посещений {total_visits} за {merge_time:.2f} с")
+
+        if args.report:
+            print()
+            print("Мероприятие;Посетителей;Сканирований;Первое;Последнее")
+            for event, visitors, scans, first, last in storage.fetch_attendance(conn):
+                print(f"{event or ''};{visitors};{scans};{first};{last}")
+    finally:
+        storage.checkpoint(conn)
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,19 @@
 import sys
+import os
 import sqlite3
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                             QLabel, QPushButton, QWidget, QTableWidget, 
                             QTableWidgetItem, QMessageBox, QComboBox)
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon, QPixmap, QFont, QImage
 import qrcode
-from pyzbar.pyzbar import decode
-import cv2
-import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+from scanner import CameraScanner
+from qr_tasks import start_export
+import visitor_export
+from functools import partial
 
 class QRScannerApp(QMainWindow):
     def __init__(self):
@@ -25,13 +29,14 @@ class QRScannerApp(QMainWindow):
         self.init_ui()
         
         # Настройка камеры
-        self.camera = cv2.VideoCapture(0)
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
+        self.scanner = None
         self.scanning = False
+        self.visitors_export_thread = None
         
     def init_db(self):
         self.conn = sqlite3.connect('visitors.db')
+        # WAL: фоновый экспорт читает базу, не мешая записи сканов
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self.cursor = self.conn.cursor()
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS visitors (
@@ -44,6 +49,9 @@ class QRScannerApp(QMainWindow):
                 event TEXT
             )
         ''')
+        # Журнал сортируется по времени и фильтруется по мероприятию - по индексам, без полного просмотра
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_visit_time ON visitors(visit_time)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_visitors_event ON visitors(event, visit_time)")
         self.conn.commit()
         
     def init_ui(self):
@@ -170,7 +178,11 @@ class QRScannerApp(QMainWindow):
                 "background-color: #d32f2f;"
                 "}"
             )
-            self.timer.start(20)
+            # Захват и распознавание выполняются в отдельных потоках
+            self.scanner = CameraScanner(0)
+            self.scanner.frame_ready.connect(self.update_frame)
+            self.scanner.qr_detected.connect(self.on_qr_detected)
+            self.scanner.start()
         else:
             self.scanning = False
             self.scan_button.setText("Начать сканирование")
@@ -188,51 +200,47 @@ class QRScannerApp(QMainWindow):
                 "background-color: #45a049;"
                 "}"
             )
-            self.timer.stop()
+            self.stop_scanner()
             # Очищаем изображение
             self.camera_label.clear()
             self.camera_label.setText("Камера отключена")
         
-    def update_frame(self):
-        ret, frame = self.camera.read()
-        if ret:
-            # Конвертируем кадр в RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Декодируем QR-код
-            decoded_objects = decode(frame)
-            
-            # Если найден QR-код
-            if decoded_objects:
-                qr_data = decoded_objects[0].data.decode('utf-8')
-                self.process_qr_code(qr_data)
-                self.timer.stop()
-                self.scanning = False
-                self.scan_button.setText("Начать сканирование")
-                self.scan_button.setStyleSheet(
-                    "QPushButton {"
-                    "background-color: #4CAF50;"
-                    "border: none;"
-                    "color: white;"
-                    "padding: 10px 24px;"
-                    "text-align: center;"
-                    "font-size: 16px;"
-                    "border-radius: 4px;"
-                    "}"
-                    "QPushButton:hover {"
-                    "background-color: #45a049;"
-                    "}"
-                )
-            
-            # Отображаем кадр
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            self.camera_label.setPixmap(QPixmap.fromImage(q_img).scaled(
-                self.camera_label.width(), 
-                self.camera_label.height(), 
-                Qt.KeepAspectRatio
-            ))
+    def stop_scanner(self):
+        if self.scanner:
+            self.scanner.stop()
+            self.scanner = None
+    
+    def on_qr_detected(self, qr_data):
+        if not self.scanning:
+            return
+        self.stop_scanner()
+        self.scanning = False
+        self.scan_button.setText("Начать сканирование")
+        self.scan_button.setStyleSheet(
+            "QPushButton {"
+            "background-color: #4CAF50;"
+            "border: none;"
+            "color: white;"
+            "padding: 10px 24px;"
+            "text-align: center;"
+            "font-size: 16px;"
+            "border-radius: 4px;"
+            "}"
+            "QPushButton:hover {"
+            "background-color: #45a049;"
+            "}"
+        )
+        self.process_qr_code(qr_data)
+    
+    def update_frame(self, q_img):
+        """Отображение кадра, полученного из потока захвата"""
+        if not self.scanning:
+            return
+        self.camera_label.setPixmap(QPixmap.fromImage(q_img).scaled(
+            self.camera_label.width(), 
+            self.camera_label.height(), 
+            Qt.KeepAspectRatio
+        ))
     
     def process_qr_code(self, qr_data):
         try:
@@ -296,20 +304,39 @@ class QRScannerApp(QMainWindow):
         self.visitor_table.resizeColumnsToContents()
     
     def export_to_excel(self):
+        if self.visitors_export_thread and self.visitors_export_thread.isRunning():
+            return
         try:
-            import pandas as pd
-            self.cursor.execute("SELECT name, phone, email, visit_time, event FROM visitors")
-            visitors = self.cursor.fetchall()
+            total = self.conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
             
-            df = pd.DataFrame(visitors, columns=["Имя", "Телефон", "Email", "Время посещения", "Мероприятие"])
-            df.to_excel("visitors.xlsx", index=False)
-            
-            QMessageBox.information(self, "Успешно", "Данные экспортированы в visitors.xlsx")
+            # Выгрузка идет пачками в фоновом потоке
+            export = partial(
+                visitor_export.export_rows, 'visitors.db',
+                "SELECT name, phone, email, visit_time, event FROM visitors",
+                ["Имя", "Телефон", "Email", "Время посещения", "Мероприятие"], "visitors.xlsx"
+            )
+            self.visitors_export_thread = start_export(
+                self, "Экспорт посетителей...", total, export,
+                partial(self.on_visitors_exported, "visitors.xlsx"), modal=False
+            )
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
     
+    def on_visitors_exported(self, file_path, cancelled, error, exported_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", "Экспорт прерван")
+        else:
+            QMessageBox.information(self, "Успешно", f"Экспортировано {exported_count} записей в {file_path}")
+    
     def closeEvent(self, event):
-        self.camera.release()
+        self.stop_scanner()
+        if self.visitors_export_thread and self.visitors_export_thread.isRunning():
+            self.visitors_export_thread.cancel()
+            self.visitors_export_thread.wait()
+        # Обновление статистики планировщика (ANALYZE) для изменившихся таблиц
+        self.conn.execute("PRAGMA optimize")
         self.conn.close()
         event.accept()
 
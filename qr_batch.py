@@ -0,0 +1,117 @@
+"""Пакетная генерация QR-кодов из Excel/CSV без графического интерфейса.
+
+Пример:
+    python qr_batch.py guests.xlsx --sheet Лист1 --column ФИО --size 300 -o badges.pdf
+
+Результат - папка с PNG, ZIP-архив или PDF для печати (по расширению -o).
+Готовые коды и PNG хранятся в дисковом кэше, поэтому повторный запуск по
+исправленному списку пересчитывает только измененные строки.
+PyQt5 не импортируется, поэтому скрипт подходит для запуска на сервере.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+import qr_cache
+import qr_engine
+import qr_export
+from table_readers import clean_values, open_table
+
+
+def resolve_column(headers, column):
+    """Номер колонки (с 1) по заголовку или номеру"""
+    if column.isdigit():
+        return int(column)
+    for col_idx, value in enumerate(headers, 1):
+        if value is not None and str(value).strip() == column:
+            return col_idx
+    raise ValueError(f"Колонка не найдена: {column}")
+
+
+def read_values(path, sheet_name, column):
+    reader = open_table(path)
+    try:
+        if sheet_name is None:
+            sheet_name = reader.sheetnames[0]
+        elif sheet_name not in reader.sheetnames:
+            raise ValueError(f"Лист не найден: {sheet_name}")
+        col_idx = resolve_column(reader.headers(sheet_name), column)
+        return list(clean_values(reader.iter_column(sheet_name, col_idx)))
+    finally:
+        reader.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация QR-кодов из Excel/CSV")
+    parser.add_argument("input", help="файл .xlsx, .xls, .csv или .tsv")
+    parser.add_argument("-s", "--sheet", help="лист (по умолчанию первый)")
+    parser.add_argument("-c", "--column", default="1", help="заголовок или номер колонки (по умолчанию 1)")
+    parser.add_argument("--size", type=int, default=300, help="размер QR-кода в пикселях")
+    parser.add_argument("-e", "--error-correction", choices=sorted(qr_engine.ERROR_CORRECTION),
+                        default="H", help="уровень коррекции ошибок")
+    parser.add_argument("-o", "--output", default="qr_codes",
+                        help="папка для PNG, файл .zip или .pdf")
+    parser.add_argument("-w", "--workers", type=int, help="количество процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--fill", default="black", help="цвет QR-кода")
+    parser.add_argument("--back", default="white", help="цвет фона")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать дисковый кэш готовых кодов и PNG")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    colors = {"fill_color": args.fill, "back_color": args.back}
+    options = dict(colors, use_cache=not args.no_cache)
+
+    started = time.perf_counter()
+    try:
+        values = read_values(args.input, args.sheet, args.column)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ошибка чтения {args.input}: {e}", file=sys.stderr)
+        return 1
+    read_time = time.perf_counter() - started
+    if not values:
+        print("В выбранной колонке нет данных", file=sys.stderr)
+        return 1
+
+    # Коды, построенные при прошлых запусках с теми же параметрами, берутся из кэша
+    cache = None if args.no_cache else qr_cache.open_cache()
+    started = time.perf_counter()
+    try:
+        items = list(qr_cache.generate_codes(
+            values, cache, args.workers, error_correction=qr_engine.ERROR_CORRECTION[args.error_correction]
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
+    generate_time = time.perf_counter() - started
+
+    extension = os.path.splitext(args.output)[1].lower()
+    started = time.perf_counter()
+    try:
+        if extension == ".pdf":
+            saved_count = qr_export.export_pdf(items, args.output, **colors)
+        elif extension == ".zip":
+            saved_count = qr_export.export_zip(items, args.output, args.size, args.workers, **options)
+        else:
+            os.makedirs(args.output, exist_ok=True)
+            saved_count = qr_export.export_png_files(items, args.output, args.size, args.workers, **options)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка сохранения {args.output}: {e}", file=sys.stderr)
+        return 1
+    export_time = time.perf_counter() - started
+
+    total_time = read_time + generate_time + export_time
+    print(f"Прочитано значений: {len(values)} за {read_time:.2f} с")
+    print(f"Сгенерировано: {len(items)} за {generate_time:.2f} с ({len(items) / max(generate_time, 1e-9):.0f} кодов/с)")
+    print(f"Сохранено: {saved_count} в {args.output} за {export_time:.2f} с ({saved_count / max(export_time, 1e-9):.0f} кодов/с)")
+    print(f"Всего: {total_time:.2f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -3,12 +3,19 @@ import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                              QWidget, QLabel, QPushButton, QFileDialog, QListWidget,
                              QMessageBox, QComboBox, QSpinBox, QFrame)
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import Qt
-import openpyxl
 import qrcode
-from PIL import Image
-import io
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_fasad"))
+from qr_tasks import start_generation, start_export
+import qr_engine
+import qr_export
+from functools import partial
+from qt_image import pil_to_qimage
+from workbook_cache import WorkbookCache
+from table_readers import FILE_FILTER
 
 
 class QRGeneratorApp(QMainWindow):
@@ -21,6 +28,13 @@ class QRGeneratorApp(QMainWindow):
         self.excel_file = None
         self.current_qr = None
         self.qr_codes = {}
+        self.qr_size = None
+        # Отрисованные коды хранятся только для недавно просмотренных записей
+        self.qr_pixmaps = qr_engine.LRUCache(32)
+        # Разобранные книги Excel: листы, заголовки и колонки читаются один раз
+        self.workbooks = WorkbookCache()
+        self.generation_thread = None
+        self.export_thread = None
         
         # Настройка стилей
         self.setStyleSheet("""
@@ -229,8 +243,20 @@ class QRGeneratorApp(QMainWindow):
         """)
         save_all_btn.clicked.connect(self.save_all_qr)
         
+        save_archive_btn = QPushButton("Сохранить в один файл (ZIP/PDF)")
+        save_archive_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #16a085;
+            }
+            QPushButton:hover {
+                background-color: #138d75;
+            }
+        """)
+        save_archive_btn.clicked.connect(self.save_qr_archive)
+        
         save_layout.addWidget(save_current_btn)
         save_layout.addWidget(save_all_btn)
+        save_layout.addWidget(save_archive_btn)
         main_layout.addWidget(save_frame)
         
         # Футер с подписью по центру
@@ -249,7 +275,7 @@ class QRGeneratorApp(QMainWindow):
     def load_excel_file(self):
         """Загрузка Excel файла"""
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Выберите файл Excel", "", "Excel Files (*.xlsx *.xls)"
+            self, "Выберите файл Excel или CSV", "", FILE_FILTER
         )
         
         if file_path:
@@ -258,10 +284,9 @@ class QRGeneratorApp(QMainWindow):
             
             # Загружаем доступные листы
             try:
-                wb = openpyxl.load_workbook(file_path, read_only=True)
+                book = self.workbooks.get(file_path)
                 self.sheet_combo.clear()
-                self.sheet_combo.addItems(wb.sheetnames)
-                wb.close()
+                self.sheet_combo.addItems(book.sheetnames)
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {str(e)}")
     
@@ -275,17 +300,14 @@ class QRGeneratorApp(QMainWindow):
         sheet_name = self.sheet_combo.currentText()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
+            headers = self.workbooks.get(self.excel_file).sheet_headers(sheet_name)
             
             # Получаем заголовки колонок из первой строки
-            for col_idx, cell in enumerate(sheet[1], 1):
-                if cell.value:  # Если ячейка не пустая
-                    self.column_combo.addItem(str(cell.value), col_idx)
+            for col_idx, value in enumerate(headers, 1):
+                if value:  # Если ячейка не пустая
+                    self.column_combo.addItem(str(value), col_idx)
                 else:
                     self.column_combo.addItem(f"Колонка {col_idx}", col_idx)
-            
-            wb.close()
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать колонки: {str(e)}")
     
@@ -294,67 +316,59 @@ class QRGeneratorApp(QMainWindow):
         if not all([self.excel_file, self.sheet_combo.currentText(), self.column_combo.currentText()]):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите файл, лист и колонку")
             return
+        if self.generation_thread and self.generation_thread.isRunning():
+            return
             
         self.data_list.clear()
         self.qr_codes = {}
+        self.qr_pixmaps.clear()
         sheet_name = self.sheet_combo.currentText()
-        column = self.column_combo.currentText()
         col_idx = self.column_combo.currentData()
-        qr_size = self.size_spin.value()
+        self.qr_size = self.size_spin.value()
         
         try:
-            wb = openpyxl.load_workbook(self.excel_file, read_only=True)
-            sheet = wb[sheet_name]
-            
-            # Читаем данные из колонки (пропускаем заголовок)
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                if len(row) >= col_idx:
-                    value = row[col_idx-1]
-                    if value is not None:
-                        value = str(value).strip()
-                        if value:
-                            # Генерируем QR-код
-                            qr = qrcode.QRCode(
-                                version=1,
-                                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                                box_size=12,
-                                border=4,
-                            )
-                            qr.add_data(value)
-                            qr.make(fit=True)
-                            
-                            img = qr.make_image(fill_color="black", back_color="white")
-                            img = img.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-                            
-                            # Сохраняем в словарь
-                            self.qr_codes[value] = img
-                            self.data_list.addItem(value)
-            
-            wb.close()
-            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+            # Колонка берется из кэша книги, файл повторно не разбирается
+            values = self.workbooks.get(self.excel_file).column(sheet_name, col_idx)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {str(e)}")
+            return
+        
+        # Генерация выполняется пулом процессов, интерфейс остается отзывчивым
+        self.generation_thread = start_generation(
+            self, values, self.add_generated_qr_codes, self.on_generation_finished,
+            error_correction=qrcode.constants.ERROR_CORRECT_H
+        )
+    
+    def add_generated_qr_codes(self, batch):
+        for value, code in batch:
+            # Хранится только компактная матрица, изображение строится по запросу
+            self.qr_codes[value] = code
+            self.data_list.addItem(value)
+    
+    def on_generation_finished(self, cancelled, error):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сгенерировать QR-коды: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Генерация прервана, готово {len(self.qr_codes)} QR-кодов")
+        else:
+            QMessageBox.information(self, "Готово", f"Сгенерировано {len(self.qr_codes)} QR-кодов")
+    
+    def render_qr(self, text):
+        return self.qr_codes[text].render(self.qr_size)
     
     def show_qr_code(self, item):
         """Отображение выбранного QR-кода"""
         text = item.text()
         if text in self.qr_codes:
-            self.current_qr = self.qr_codes[text]
+            self.current_qr = text
             
-            # Конвертируем PIL.Image в QPixmap через байты
-            img_byte_arr = io.BytesIO()
-            self.current_qr.save(img_byte_arr, format='PNG')
-            qimage = QImage.fromData(img_byte_arr.getvalue())
-            pixmap = QPixmap.fromImage(qimage)
-            
-            # Масштабируем с сохранением пропорций
             display_size = min(self.qr_display.width(), self.qr_display.height()) - 20
-            pixmap = pixmap.scaled(
-                display_size, 
-                display_size,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            pixmap = self.qr_pixmaps.get((text, display_size))
+            if pixmap is None:
+                # Код рисуется сразу в размере области просмотра, без масштабирования
+                img = self.qr_codes[text].render(display_size)
+                pixmap = QPixmap.fromImage(pil_to_qimage(img))
+                self.qr_pixmaps.put((text, display_size), pixmap)
             
             self.qr_display.setPixmap(pixmap)
     
@@ -375,7 +389,7 @@ class QRGeneratorApp(QMainWindow):
         
         if file_path:
             try:
-                self.current_qr.save(file_path)
+                self.render_qr(self.current_qr).save(file_path)
                 QMessageBox.information(self, "Успешно", "QR-код сохранен")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл: {str(e)}")
@@ -385,24 +399,64 @@ class QRGeneratorApp(QMainWindow):
         if not self.qr_codes:
             QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
             return
+        if self.export_thread and self.export_thread.isRunning():
+            return
             
         dir_path = QFileDialog.getExistingDirectory(self, "Выберите папку для сохранения")
         
         if dir_path:
-            try:
-                saved_count = 0
-                for text, img in self.qr_codes.items():
-                    safe_text = "".join(c for c in text if c.isalnum() or c in (' ', '_')).rstrip()
-                    file_path = os.path.join(dir_path, f"{safe_text}.png")
-                    img.save(file_path, "PNG")
-                    saved_count += 1
-                
-                QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {str(e)}")
+            # PNG кодируются пулом процессов в фоновом потоке
+            items = list(self.qr_codes.items())
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items),
+                partial(qr_export.export_png_files, items, dir_path, self.qr_size),
+                self.on_export_finished
+            )
+    
+    def save_qr_archive(self):
+        """Сохранение всех QR-кодов в один ZIP-архив или PDF для печати"""
+        if not self.qr_codes:
+            QMessageBox.warning(self, "Ошибка", "Нет QR-кодов для сохранения")
+            return
+        if self.export_thread and self.export_thread.isRunning():
+            return
+        
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "Сохранить в один файл", "qr_codes.zip",
+            "ZIP-архив (*.zip);;PDF для печати (*.pdf)"
+        )
+        
+        if file_path:
+            items = list(self.qr_codes.items())
+            if file_path.lower().endswith(".pdf") or (
+                    "pdf" in selected_filter and not file_path.lower().endswith(".zip")):
+                # Листы A4 по 24 кода, запись идет постранично
+                export = partial(qr_export.export_pdf, items, file_path)
+            else:
+                export = partial(qr_export.export_zip, items, file_path, self.qr_size)
+            self.export_thread = start_export(
+                self, "Сохранение QR-кодов...", len(items), export, self.on_export_finished
+            )
+    
+    def on_export_finished(self, cancelled, error, saved_count):
+        if error:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файлы: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Отменено", f"Сохранение прервано, сохранено {saved_count} QR-кодов")
+        else:
+            QMessageBox.information(self, "Успешно", f"Сохранено {saved_count} QR-кодов")
+    
+    def closeEvent(self, event):
+        for thread in (self.generation_thread, self.export_thread):
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
+        self.workbooks.clear()
+        event.accept()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     window = QRGeneratorApp()
@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['qr_color.py'],
-    pathex=[],
+    pathex=['history_fasad'],
     binaries=[],
     datas=[],
     hiddenimports=[],